@@ -0,0 +1,337 @@
+import numpy as np
+import pandas as pd
+
+from dataset import load_or_build, subset_tables, write_snapshot
+
+# Fenêtre d'années prise en compte pour les alertes
+ANNEE_DEBUT = 2019
+ANNEE_FIN = 2024
+
+# Catégories IMC dans l'ordre de gravité
+IMC_NIVEAUX = [
+    "Normal",
+    "Surpoids",
+    "Obésité modérée",
+    "Obésité sévère",
+    "Obésité massive",
+]
+IMC_SEUILS = [25, 30, 35, 40]
+
+TOUR_COL = "périmétre abdominal"
+
+# Format de la table sauvegardée (voir dataset.load_or_build)
+ALERT_TABLE_FORMAT = 3
+
+# Affectation reprise dans la liste des alertes (grade de la première ligne,
+# unité de la dernière, comme sur la fiche agent)
+AFFECTATION_COLS = ["groupement", "compagnie", "cis", "grade"]
+
+# Types d'alerte filtrables -> libellé affiché
+TYPES_ALERTE = {"sante": "Santé", "tests": "Tests physiques"}
+
+
+def imc_niveau(imc):
+    # Indice dans IMC_NIVEAUX (0 = Normal ... 4 = Obésité massive)
+    return np.searchsorted(IMC_SEUILS, imc, side="right")
+
+
+def _dans_fenetre(data):
+    return data[data["année"].between(ANNEE_DEBUT, ANNEE_FIN)]
+
+
+def _avec_position(df, colonnes):
+    # La position d'origine sert à départager les lignes d'une même année
+    data = df[["matricule", "année", *colonnes]].copy()
+    data["_pos"] = np.arange(len(data))
+    return data
+
+
+def analyse_baisses(df, tests):
+    """Une ligne par (matricule, test) : valeur max, valeur récente et % de baisse."""
+    tests = [t for t in tests if t in df.columns]
+    colonnes = [
+        "matricule",
+        "test",
+        "valeur_max",
+        "annee_max",
+        "valeur_recent",
+        "annee_recent",
+        "pourcentage",
+    ]
+    if not tests:
+        return pd.DataFrame(columns=colonnes)
+
+    data = _avec_position(df, tests)
+    long = data.melt(
+        id_vars=["matricule", "année", "_pos"],
+        value_vars=tests,
+        var_name="test",
+        value_name="valeur",
+    )
+    long = long.dropna(subset=["matricule", "année", "valeur"])
+    long = long[long["année"].isin(range(ANNEE_DEBUT, ANNEE_FIN + 1))]
+    long = long.sort_values(["matricule", "test", "année", "_pos"], kind="stable")
+
+    groupes = long.groupby(["matricule", "test"], sort=False)
+    long = long[groupes["valeur"].transform("size") >= 2]
+    groupes = long.groupby(["matricule", "test"], sort=False)
+
+    # Valeur max : première occurrence dans l'ordre d'origine des lignes
+    val_max = groupes["valeur"].transform("max")
+    premiers_max = (
+        long[long["valeur"] == val_max]
+        .sort_values("_pos", kind="stable")
+        .groupby(["matricule", "test"], sort=False)
+        .head(1)
+        .set_index(["matricule", "test"])
+    )
+    recents = groupes.tail(1).set_index(["matricule", "test"])
+
+    res = pd.DataFrame(
+        {
+            "valeur_max": premiers_max["valeur"],
+            "annee_max": premiers_max["année"],
+        }
+    ).join(
+        recents[["valeur", "année"]].rename(
+            columns={"valeur": "valeur_recent", "année": "annee_recent"}
+        )
+    )
+    res = res[res["valeur_max"] != 0]
+    res["pourcentage"] = (
+        (res["valeur_max"] - res["valeur_recent"]) / res["valeur_max"] * 100
+    )
+    return res.reset_index()[colonnes]
+
+
+def alerte_tests(baisses):
+    """Message d'alerte tests physiques par matricule (règles 30 / 2×20 / 3×10 %)."""
+    pct = baisses.set_index("matricule")["pourcentage"]
+    comptes = pd.DataFrame(
+        {
+            "b30": (pct >= 30).groupby(level=0).sum(),
+            "b20": (pct >= 20).groupby(level=0).sum(),
+            "b10": (pct >= 10).groupby(level=0).sum(),
+        }
+    )
+    message = pd.Series(None, index=comptes.index, dtype=object)
+    message[comptes["b10"] >= 3] = (
+        "⚠️ Alerte : trois tests ou plus ont baissé de ≥ 10%."
+    )
+    message[comptes["b20"] >= 2] = "⚠️ Alerte : deux tests ont baissé de ≥ 20%."
+    message[comptes["b30"] >= 1] = (
+        "⚠️ Alerte : une baisse ≥ 30% a été détectée sur un test."
+    )
+    return message.dropna()
+
+
+def _alertes_imc(df):
+    data = _avec_position(df, ["imc"]).dropna(subset=["matricule", "année", "imc"])
+    data = _dans_fenetre(data).sort_values(
+        ["matricule", "année", "_pos"], kind="stable"
+    )
+    groupes = data.groupby("matricule", sort=False)
+    data = data[groupes["imc"].transform("size") >= 2]
+    groupes = data.groupby("matricule", sort=False)
+
+    debut = groupes.head(1).set_index("matricule")
+    fin = groupes.tail(1).set_index("matricule")
+    niv_debut = imc_niveau(debut["imc"].to_numpy())
+    niv_fin = imc_niveau(fin["imc"].to_numpy())
+    hausse = niv_fin > niv_debut
+
+    details = [
+        f"IMC est passé de {d_imc:.1f} ({IMC_NIVEAUX[n_d]}) en {int(d_an)} "
+        f"à {f_imc:.1f} ({IMC_NIVEAUX[n_f]}) en {int(f_an)}"
+        for d_imc, d_an, n_d, f_imc, f_an, n_f in zip(
+            debut["imc"][hausse],
+            debut["année"][hausse],
+            niv_debut[hausse],
+            fin["imc"][hausse],
+            fin["année"][hausse],
+            niv_fin[hausse],
+        )
+    ]
+    return pd.Series(details, index=debut.index[hausse], dtype=object)
+
+
+def _alertes_tour(mesures, agents):
+    sexe = agents["sexe"].dropna().astype(str).str.strip().str.lower()
+
+    data = _avec_position(mesures, [TOUR_COL]).dropna(
+        subset=["matricule", "année", TOUR_COL]
+    )
+    data = data[data["matricule"].isin(sexe.index)]
+    data = _dans_fenetre(data).sort_values(
+        ["matricule", "année", "_pos"], kind="stable"
+    )
+    data = data[data.groupby("matricule", sort=False)[TOUR_COL].transform("size") >= 2]
+
+    sexe_ligne = data["matricule"].map(sexe)
+    data["seuil"] = np.where(sexe_ligne == "homme", 94, 80)
+    data["sexe"] = sexe_ligne
+    depasse = data[data[TOUR_COL] > data["seuil"]]
+    premier = depasse.groupby("matricule", sort=False).head(1).set_index("matricule")
+
+    details = [
+        f"Tour de taille a dépassé {seuil} cm ({s}) en {int(an)} avec {val:.1f} cm"
+        for seuil, s, an, val in zip(
+            premier["seuil"], premier["sexe"], premier["année"], premier[TOUR_COL]
+        )
+    ]
+    return pd.Series(details, index=premier.index, dtype=object)
+
+
+def analyse_sante(tables):
+    """Détails des alertes santé (IMC, tour de taille) par matricule."""
+    mesures = tables.mesures
+    colonnes = {}
+    if "imc" in mesures.columns:
+        colonnes["imc"] = _alertes_imc(mesures)
+    if TOUR_COL in mesures.columns and "sexe" in tables.agents.columns:
+        colonnes["tour"] = _alertes_tour(mesures, tables.agents)
+    return pd.DataFrame(colonnes, columns=["imc", "tour"], dtype=object)
+
+
+def affectations(table):
+    """Affectation par matricule : grade de la première ligne, unité de la dernière."""
+    colonnes = [c for c in AFFECTATION_COLS if c in table.columns]
+    groupes = table[["matricule", *colonnes]].groupby(
+        "matricule", sort=False, observed=True
+    )
+    premiere = groupes.head(1).set_index("matricule")
+    derniere = groupes.tail(1).set_index("matricule")
+    if "grade" in colonnes:
+        derniere["grade"] = premiere["grade"]
+    derniere = derniere.astype(object)
+    return derniere.where(derniere.notna(), None).to_dict("index")
+
+
+def _liste_alertes(tables, sante, tests_alerte):
+    sante = sante.dropna(how="all")
+    par_matricule = affectations(tables.affectations)
+    alertes_liste = []
+    for mat in tables.agents.index:
+        types = []
+        if mat in sante.index:
+            types.append(TYPES_ALERTE["sante"])
+        if mat in tests_alerte.index:
+            types.append(TYPES_ALERTE["tests"])
+        if types:
+            alertes_liste.append(
+                {
+                    "matricule": mat,
+                    "nombre": len(types),
+                    "types": ", ".join(types),
+                    **{c: par_matricule[mat].get(c) for c in AFFECTATION_COLS},
+                }
+            )
+    return alertes_liste
+
+
+def filtrer_alertes(liste, filtres=None, type_alerte=None, tri=None, desc=False):
+    """Filtre la liste précalculée (égalité sur l'affectation, type d'alerte) et la trie."""
+    filtres = {c: v for c, v in (filtres or {}).items() if v}
+    # Type inconnu ignoré, comme un tri inconnu
+    libelle = TYPES_ALERTE.get(type_alerte)
+    resultat = [
+        alerte
+        for alerte in liste
+        if all(alerte.get(c) == v for c, v in filtres.items())
+        and (libelle is None or libelle in alerte["types"])
+    ]
+    if tri in ("matricule", "nombre", *AFFECTATION_COLS):
+        # Matricules dans l'ordre numérique ; valeurs manquantes toujours en dernier
+        cle = (lambda v: (len(v), v)) if tri == "matricule" else (lambda v: v)
+        manquantes = [alerte for alerte in resultat if alerte[tri] is None]
+        resultat = sorted(
+            (alerte for alerte in resultat if alerte[tri] is not None),
+            key=lambda alerte: cle(alerte[tri]),
+            reverse=desc,
+        )
+        resultat += manquantes
+    return resultat
+
+
+def build_alert_table(tables, test_labels):
+    """Table matérialisée : liste /alertes et bandeau d'alerte par matricule."""
+    baisses = analyse_baisses(tables.mesures, test_labels)
+    sante = analyse_sante(tables)
+    tests_alerte = alerte_tests(baisses)
+    ordre_tests = {test: i for i, test in enumerate(test_labels)}
+
+    par_agent = {}
+    for mat, detail in sante.iterrows():
+        for cle, texte in detail.dropna().items():
+            agent = par_agent.setdefault(mat, _agent_vide())
+            agent["alertes_sante"].append(cle)
+            agent["alertes_sante_details"].append(texte)
+
+    detaillees = baisses[baisses["pourcentage"] >= 10].copy()
+    detaillees["_ordre"] = detaillees["test"].map(ordre_tests)
+    detaillees = detaillees.sort_values(["matricule", "_ordre"], kind="stable")
+    for row in detaillees.itertuples(index=False):
+        agent = par_agent.setdefault(row.matricule, _agent_vide())
+        agent["baisses_detaillees"].append(
+            {
+                "test": test_labels[row.test],
+                "pourcentage": round(float(row.pourcentage), 1),
+                "valeur_max": float(row.valeur_max),
+                "annee_max": int(row.annee_max),
+                "valeur_recent": float(row.valeur_recent),
+                "annee_recent": int(row.annee_recent),
+            }
+        )
+
+    for mat, message in tests_alerte.items():
+        par_agent.setdefault(mat, _agent_vide())["alerte"] = message
+
+    return {
+        "liste": _liste_alertes(tables, sante, tests_alerte),
+        "par_agent": par_agent,
+    }
+
+
+def _agent_vide():
+    return {
+        "alerte": None,
+        "baisses_detaillees": [],
+        "alertes_sante": [],
+        "alertes_sante_details": [],
+    }
+
+
+def load_alert_table(tables, test_labels, key, cache_path=None):
+    """Charge la table depuis cache_path si l'empreinte correspond, sinon la recalcule."""
+    return load_or_build(
+        cache_path,
+        f"{key}-v{ALERT_TABLE_FORMAT}",
+        lambda: build_alert_table(tables, test_labels),
+    )
+
+
+def save_alert_table(cache_path, key, table):
+    write_snapshot(cache_path, f"{key}-v{ALERT_TABLE_FORMAT}", table)
+
+
+def update_alert_table(
+    table, tables, index, affectations_index, test_labels, matricules
+):
+    """Table après modification des données de `matricules` (tables et index à jour).
+
+    Les alertes d'un agent ne dépendent que de ses données : seuls les agents
+    modifiés sont recalculés. La liste garde l'ordre d'apparition des matricules.
+    """
+    matricules = set(matricules)
+    partielle = build_alert_table(
+        subset_tables(tables, index, affectations_index, sorted(matricules)),
+        test_labels,
+    )
+    par_agent = {
+        mat: agent for mat, agent in table["par_agent"].items() if mat not in matricules
+    }
+    par_agent.update(partielle["par_agent"])
+    liste = [a for a in table["liste"] if a["matricule"] not in matricules]
+    liste += partielle["liste"]
+    liste.sort(key=lambda alerte: index[alerte["matricule"]][0])
+    return {"liste": liste, "par_agent": par_agent}
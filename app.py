@@ -1,12 +1,53 @@
-from flask import Flask, render_template, request, Response
-import pandas as pd
+from flask import (
+    Flask,
+    render_template,
+    request,
+    Response,
+    abort,
+    jsonify,
+    stream_with_context,
+    url_for,
+)
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timezone
+from collections import namedtuple
+import base64
+import csv
+import io
+import json
 import os
-import matplotlib
 
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
-import io
-import base64
+from alert_engine import (
+    AFFECTATION_COLS,
+    TYPES_ALERTE,
+    filtrer_alertes,
+    load_alert_table,
+)
+from chart_cache import ChartCache
+from chart_pool import ChartPool
+from cohorts import agent_percentiles, load_cohorts
+import charts as charts_png
+import charts_svg
+from dataset import (
+    DatasetStore,
+    agent_profiles,
+    agent_rows,
+    build_matricule_index,
+    load_dataset_cached,
+    rows_for_matricules,
+    rows_version,
+    source_key,
+)
+from matricule_search import (
+    SUGGESTIONS,
+    SUGGESTIONS_MAX,
+    build_matricule_search,
+    normalize_prefix,
+    search_matricules,
+)
+from metrics import Metrics
+from rollups import NIVEAUX, drill_down, load_rollups
+import pandas as pd
 
 app = Flask(__name__)
 
@@ -34,21 +75,7 @@ def requires_auth(f):
     return decorated
 
 
-# Charger les données une fois
 DATA_PATH = "dataset_corrige.csv"
-df = pd.read_csv(DATA_PATH, dtype={"matricule": str})
-df["sexe"] = (
-    df["sexe"]
-    .astype(str)
-    .str.strip()
-    .str.lower()
-    .replace({"m": "homme", "f": "femme", "h": "homme"})
-)
-
-df.columns = df.columns.str.strip().str.lower()
-df["matricule"] = (
-    df["matricule"].astype(str).str.strip().str.replace(".0", "", regex=False)
-)
 
 # Dictionnaire test + labels
 test_labels = {
@@ -70,79 +97,225 @@ niveau_cols = {
     "resul tractions": "niv tractions",
 }
 
+# Une version des données : les tables agents / affectations / mesures, les
+# positions des mesures et des affectations de chaque matricule, la table
+# d'alertes et les résultats triés de chaque cohorte pour les percentiles
+# et les indicateurs par unité et par année (sauvegardés à côté du CSV), les
+# matricules triés pour l'autocomplétion et les empreintes des agents déjà
+# consultés (remplies au fil des requêtes, voir agent_version)
+Donnees = namedtuple(
+    "Donnees",
+    [
+        "version",
+        "modified",
+        "tables",
+        "index",
+        "affectations_index",
+        "alertes",
+        "cohortes",
+        "unites",
+        "recherche",
+        "empreintes",
+    ],
+)
+
+
+def table_path(path, nom):
+    # Table dérivée sauvegardée à côté du CSV : dataset_corrige.<nom>.pkl
+    return os.path.splitext(path)[0] + f".{nom}.pkl"
+
+
+def charger_donnees(path):
+    version = source_key(path)
+    modified = datetime.fromtimestamp(int(os.path.getmtime(path)), timezone.utc)
+    tables = load_dataset_cached(path, version)
+    index = build_matricule_index(tables.mesures)
+    affectations_index = build_matricule_index(tables.affectations)
+    alertes = load_alert_table(
+        tables, test_labels, version, table_path(path, "alertes")
+    )
+    return Donnees(
+        version=version,
+        modified=modified,
+        tables=tables,
+        index=index,
+        affectations_index=affectations_index,
+        alertes=alertes,
+        cohortes=load_cohorts(
+            tables, list(test_labels), version, table_path(path, "cohortes")
+        ),
+        unites=load_rollups(
+            tables, alertes, niveau_cols, version, table_path(path, "rollups")
+        ),
+        recherche=build_matricule_search(tables, index, affectations_index),
+        empreintes={},
+    )
 
-# Fonction pour convertir matplotlib en base64
-def fig_to_base64(fig):
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    return base64.b64encode(buf.read()).decode("utf-8")
-
-
-def generate_alertes_sante_evolution(agent_data):
-    alertes_sante = []
-    alertes_sante_details = []
-
-    # --- IMC ---
-    if "imc" in agent_data.columns:
-        imc_data = agent_data[["année", "imc"]].dropna()
-        imc_data = imc_data[imc_data["année"].between(2019, 2024)]
-        imc_data = imc_data.sort_values("année")
-        if len(imc_data) >= 2:
-
-            def imc_categorie(imc):
-                if imc >= 40:
-                    return "Obésité massive"
-                elif imc >= 35:
-                    return "Obésité sévère"
-                elif imc >= 30:
-                    return "Obésité modérée"
-                elif imc >= 25:
-                    return "Surpoids"
-                else:
-                    return "Normal"
-
-            debut = imc_data.iloc[0]
-            fin = imc_data.iloc[-1]
-            cat_debut = imc_categorie(debut["imc"])
-            cat_fin = imc_categorie(fin["imc"])
-            if cat_fin != cat_debut:
-                niveau = [
-                    "Normal",
-                    "Surpoids",
-                    "Obésité modérée",
-                    "Obésité sévère",
-                    "Obésité massive",
-                ]
-                if niveau.index(cat_fin) > niveau.index(cat_debut):
-                    alertes_sante.append("imc")
-                    alertes_sante_details.append(
-                        f"IMC est passé de {debut['imc']:.1f} ({cat_debut}) en {int(debut['année'])} à {fin['imc']:.1f} ({cat_fin}) en {int(fin['année'])}"
-                    )
-
-    # --- Tour de taille ---
-    if "périmétre abdominal" in agent_data.columns and "sexe" in agent_data.columns:
-        sexe_data = agent_data["sexe"].dropna()
-        if not sexe_data.empty:
-            sexe = sexe_data.iloc[-1].strip().lower()
-            tour_data = agent_data[["année", "périmétre abdominal"]].dropna()
-            tour_data = tour_data[tour_data["année"].between(2019, 2024)].sort_values(
-                "année"
-            )
-            if len(tour_data) >= 2:
-                seuil = 94 if sexe == "homme" else 80
-                seuil_depasse_annee = tour_data[
-                    tour_data["périmétre abdominal"] > seuil
-                ]
-                if not seuil_depasse_annee.empty:
-                    annee_depasse = int(seuil_depasse_annee.iloc[0]["année"])
-                    valeur = seuil_depasse_annee.iloc[0]["périmétre abdominal"]
-                    alertes_sante.append("tour")
-                    alertes_sante_details.append(
-                        f"Tour de taille a dépassé {seuil} cm ({sexe}) en {annee_depasse} avec {valeur:.1f} cm"
-                    )
-
-    return alertes_sante, alertes_sante_details
+
+# Chargées une fois au démarrage, puis rechargées en arrière-plan quand
+# dataset_corrige.csv est remplacé (vérification toutes les DATA_CHECK_INTERVAL s)
+data_store = DatasetStore(
+    DATA_PATH,
+    charger_donnees,
+    check_interval=float(os.environ.get("DATA_CHECK_INTERVAL", "5")),
+)
+
+# Cache des graphiques rendus : en mémoire par défaut, ou dans un répertoire
+# partagé entre les workers gunicorn si CHART_CACHE_DIR est défini
+chart_cache = ChartCache(
+    max_bytes=int(os.environ.get("CHART_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    directory=os.environ.get("CHART_CACHE_DIR") or None,
+)
+
+# Format des graphiques de la page agent : "png" (matplotlib) ou "svg" (généré
+# directement depuis les données, bien moins coûteux en CPU). Les deux restent
+# servis par /agent/<matricule>/chart/<kind>.<format>.
+CHART_FORMAT = os.environ.get("CHART_FORMAT", "png")
+CHART_RENDERERS = {"png": charts_png, "svg": charts_svg}
+CHART_MIMETYPES = {"png": "image/png", "svg": "image/svg+xml"}
+if CHART_FORMAT not in CHART_RENDERERS:
+    raise ValueError(
+        f"CHART_FORMAT={CHART_FORMAT!r} inconnu : {' ou '.join(CHART_RENDERERS)}"
+    )
+
+# Avec CHART_RENDER_WORKERS=N, la page agent rend ses graphiques en parallèle
+# dans un pool de N processus par worker et les intègre directement à la page
+# (data URI) au lieu de laisser le navigateur les demander un par un.
+chart_pool = ChartPool(int(os.environ.get("CHART_RENDER_WORKERS", "0")))
+
+# Durées par étape et compteurs, exposés sur /metrics (METRICS_ENABLED=0 pour
+# désactiver) et dans l'en-tête Server-Timing si METRICS_SERVER_TIMING=1
+metrics = Metrics(
+    enabled=os.environ.get("METRICS_ENABLED", "1") != "0",
+    server_timing=os.environ.get("METRICS_SERVER_TIMING", "0") == "1",
+)
+metrics.init_app(app)
+
+
+def _natif(valeur):
+    # Valeur Python sérialisable en JSON (NaN / NA -> None)
+    if valeur is None or pd.isna(valeur):
+        return None
+    return valeur.item() if hasattr(valeur, "item") else valeur
+
+
+def na(valeur):
+    return "N/A" if valeur is None else valeur
+
+
+def fiches_agents(donnees, matricules):
+    """Champs calculés de la fiche agent (sans graphiques), par matricule trouvé."""
+    profils = agent_profiles(
+        donnees.tables, donnees.index, donnees.affectations_index, matricules
+    )
+    percentiles = agent_percentiles(
+        donnees.cohortes,
+        rows_for_matricules(donnees.tables.mesures, donnees.index, profils.index),
+        profils,
+        test_labels,
+    )
+    fiches = {}
+    for matricule, profil in profils.to_dict("index").items():
+        fiche = {"matricule": matricule}
+        fiche.update({cle: _natif(v) for cle, v in profil.items()})
+        grade = fiche["grade"]
+        fiche["grade_image"] = (
+            f"/static/grades/{grade.lower().replace(' ', '_')}.png" if grade else None
+        )
+        alertes_agent = donnees.alertes["par_agent"].get(matricule, {})
+        fiche["alerte"] = alertes_agent.get("alerte")
+        for cle in ("baisses_detaillees", "alertes_sante", "alertes_sante_details"):
+            fiche[cle] = alertes_agent.get(cle, [])
+        fiche["percentiles"] = percentiles[matricule]
+        fiches[matricule] = fiche
+    return fiches
+
+
+def agent_version(donnees, matricule, agent_data):
+    # Empreinte des lignes de l'agent, calculée une fois par version des
+    # données : ses graphiques (cache, ETag, URL) restent valides d'une
+    # version à l'autre tant que ses lignes ne changent pas
+    version = donnees.empreintes.get(matricule)
+    if version is None:
+        version = donnees.empreintes[matricule] = rows_version(agent_data)
+    return version
+
+
+def chart_kind(test):
+    # "resul pompes" -> "pompes"
+    return test.replace("resul ", "")
+
+
+def render_chart(version, matricule, kind, render, *args, format="png"):
+    def rendu():
+        metrics.inc("chart_renders_total", kind=kind, format=format)
+        with metrics.span("render", kind=kind, format=format):
+            return render(*args)
+
+    return chart_cache.get_or_render((matricule, kind, version, format), rendu)
+
+
+def render_charts(version, matricule, disponibles, format="png"):
+    # Tous les graphiques d'un agent : ceux absents du cache sont rendus en
+    # parallèle dans chart_pool, puis mis en cache
+    images, taches = {}, {}
+    for kind, (_, render, args) in disponibles.items():
+        data = chart_cache.get((matricule, kind, version, format))
+        if data is None:
+            taches[kind] = (render, args)
+            metrics.inc("chart_renders_total", kind=kind, format=format)
+        else:
+            images[kind] = data
+    with metrics.span("render", kind="concurrent", format=format):
+        rendus = chart_pool.render_all(taches)
+    for kind, data in rendus.items():
+        if data is not None:
+            chart_cache.put((matricule, kind, version, format), data)
+            images[kind] = data
+    return images
+
+
+def data_uri(data, format):
+    return f"data:{CHART_MIMETYPES[format]};base64," + base64.b64encode(data).decode()
+
+
+def agent_charts(agent_data, format="png"):
+    # Graphiques disponibles pour un agent : kind -> (titre, rendu, arguments)
+    renderer = CHART_RENDERERS[format]
+    charts = {}
+    for test, label in test_labels.items():
+        if test not in agent_data.columns:
+            continue
+        niveau_col = niveau_cols.get(test)
+        if not niveau_col or niveau_col not in agent_data.columns:
+            continue
+        charts[chart_kind(test)] = (
+            label,
+            renderer.render_test_chart,
+            (agent_data, test, label, niveau_col),
+        )
+
+    if "imc" in agent_data.columns and not agent_data[["année", "imc"]].dropna().empty:
+        charts["imc"] = ("IMC", renderer.render_imc_chart, (agent_data,))
+
+    if (
+        "périmétre abdominal" in agent_data.columns
+        and "sexe" in agent_data.columns
+        and not agent_data[["année", "périmétre abdominal"]].dropna().empty
+    ):
+        charts["tour"] = ("Tour de Taille", renderer.render_tour_chart, (agent_data,))
+    return charts
+
+
+def chart_url(version, matricule, kind, format=None):
+    # La version dans l'URL permet au navigateur de garder l'image en cache
+    return url_for(
+        "agent_chart",
+        matricule=matricule,
+        kind=kind,
+        format=format or CHART_FORMAT,
+        v=version[:12],
+    )
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -152,442 +325,387 @@ def index():
 
     if request.method == "POST":
         matricule = request.form.get("matricule", "").strip()
-        agent_data = df[df["matricule"] == matricule]
+        donnees = data_store.get()
+        with metrics.span("lookup"):
+            agent_data = agent_rows(donnees.tables, donnees.index, matricule)
 
         if agent_data.empty:
             error = f"Matricule {matricule} non trouvé."
             return render_template("index.html", error=error)
 
         # --- infos agent ---
-        grade = agent_data["grade"].iloc[0] if "grade" in agent_data else "Inconnu"
+        with metrics.span("fiche"):
+            fiche = fiches_agents(donnees, [matricule])[matricule]
+        grade = fiche["grade"] or "Inconnu"
         grade_image = f"/static/grades/{grade.lower().replace(' ', '_')}.png"
         poids = "N/A"
-        for an in range(2024, 2010, -1):
-            poids_annee = agent_data[agent_data["année"] == an]["poids"].dropna()
-            if not poids_annee.empty:
-                poids = f" {poids_annee.iloc[0]} ({an})"
-                break
-
-        taille = (
-            agent_data["taille"].dropna().iloc[-1]
-            if "taille" in agent_data and not agent_data["taille"].dropna().empty
-            else "N/A"
-        )
+        if fiche["poids"] is not None:
+            poids = f" {fiche['poids']} ({fiche['poids_annee']})"
+        taille = na(fiche["taille"])
+        localisation = na(fiche["localisation"])
+        age = na(fiche["age"])
+        categorie = na(fiche["categorie"])
+        genre = na(fiche["genre"])
+        alertes_sante = fiche["alertes_sante"]
+        alertes_sante_details = fiche["alertes_sante_details"]
+
+        # --- graphiques : servis séparément par /agent/<matricule>/chart/<kind>.<ext>
+        with metrics.span("charts"):
+            disponibles = agent_charts(agent_data, CHART_FORMAT)
+            version = agent_version(donnees, matricule, agent_data)
+        if chart_pool.workers:
+            # ... ou rendus ici en parallèle et intégrés à la page
+            images = render_charts(version, matricule, disponibles, CHART_FORMAT)
+
+            def source(kind):
+                return data_uri(images[kind], CHART_FORMAT)
 
-        localisation = agent_data["cis"].iloc[-1] if "cis" in agent_data else "N/A"
-        age = (
-            agent_data["age"].dropna().iloc[-1]
-            if "age" in agent_data and not agent_data["age"].dropna().empty
-            else "N/A"
-        )
+        else:
 
-        categorie = (
-            agent_data["catégorie"].iloc[-1] if "catégorie" in agent_data else "N/A"
-        )
-        genre = agent_data["sexe"].iloc[-1] if "sexe" in agent_data else "N/A"
-        alertes_sante, alertes_sante_details = generate_alertes_sante_evolution(
-            agent_data
-        )
+            def source(kind):
+                return chart_url(version, matricule, kind)
 
-        # --- graphiques physiques ---
-        charts = []
-        for test, label in test_labels.items():
-            if test not in agent_data.columns:
-                continue
-            niveau_col = niveau_cols.get(test)
-            if not niveau_col or niveau_col not in agent_data.columns:
-                continue
-
-            fig, ax = plt.subplots(figsize=(6, 3.5))
-            x = agent_data["année"]
-            y = agent_data[test]
-            niveaux = agent_data[niveau_col]
-
-            colors = niveaux.map({1: "red", 2: "orange", 3: "green"}).fillna("gray")
-            fig.patch.set_facecolor("#1a1a1a")
-            ax.set_facecolor("#1a1a1a")
-            scatter = ax.scatter(
-                x, y, c=colors, s=100, edgecolors="white", linewidths=1.5
-            )
-
-            for i, val in enumerate(y):
-                ax.annotate(
-                    f"{val}",
-                    (x.iloc[i], y.iloc[i]),
-                    textcoords="offset points",
-                    xytext=(0, 6),
-                    ha="center",
-                    fontsize=9,
-                    color="white",
-                )
-
-            ax.set_title(f"{label}", color="white")
-            ax.set_xlabel("Année", color="white")
-            ax.set_ylabel("Résultat", color="white")
-            ax.tick_params(colors="white")
-            ax.grid(True, linestyle="--", alpha=0.3)
-
-            from matplotlib.lines import Line2D
-
-            legend_elements = [
-                Line2D(
-                    [0],
-                    [0],
-                    marker="o",
-                    color="w",
-                    label="Niveau 1",
-                    markerfacecolor="red",
-                    markersize=9,
-                ),
-                Line2D(
-                    [0],
-                    [0],
-                    marker="o",
-                    color="w",
-                    label="Niveau 2",
-                    markerfacecolor="orange",
-                    markersize=9,
-                ),
-                Line2D(
-                    [0],
-                    [0],
-                    marker="o",
-                    color="w",
-                    label="Niveau 3",
-                    markerfacecolor="green",
-                    markersize=9,
-                ),
-            ]
-            ax.legend(
-                handles=legend_elements,
-                loc="best",
-                facecolor="#2a2a2a",
-                edgecolor="#444",
-                labelcolor="white",
-            )
-            fig.tight_layout()
-            charts.append((label, fig_to_base64(fig)))
+        charts = [
+            (label, source(kind))
+            for kind, (label, _, _) in disponibles.items()
+            if kind not in ("imc", "tour")
+        ]
+        imc_chart = tour_chart = None
+        if "imc" in disponibles:
+            imc_chart = source("imc")
+        if "tour" in disponibles:
+            tour_chart = source("tour")
 
         # --- Analyse des baisses ---
-        baisses = []
-        baisses_detaillees = []
-
-        for test, label in test_labels.items():
-            if test not in agent_data.columns:
-                continue
-
-            test_data = agent_data[["année", test]].dropna()
-            if test_data.empty:
-                continue
-
-            valeurs = test_data.set_index("année")[test]
-            valeurs = valeurs.loc[valeurs.index.isin(range(2019, 2025))]
-
-            if len(valeurs) < 2:
-                continue
-
-            val_max = valeurs.max()
-            an_max = valeurs.idxmax()
-            val_recent = valeurs.sort_index().iloc[-1]
-            an_recent = valeurs.sort_index().index[-1]
-
-            if val_max == 0:
-                continue
-
-            baisse_pct = ((val_max - val_recent) / val_max) * 100
-            baisses.append(baisse_pct)
-
-            if baisse_pct >= 10:
-                baisses_detaillees.append(
-                    {
-                        "test": label,
-                        "pourcentage": round(baisse_pct, 1),
-                        "valeur_max": val_max,
-                        "annee_max": an_max,
-                        "valeur_recent": val_recent,
-                        "annee_recent": an_recent,
-                    }
-                )
-
-        alerte = None
-        if any(b >= 30 for b in baisses):
-            alerte = "⚠️ Alerte : une baisse ≥ 30% a été détectée sur un test."
-        elif sum(1 for b in baisses if b >= 20) >= 2:
-            alerte = "⚠️ Alerte : deux tests ont baissé de ≥ 20%."
-        elif sum(1 for b in baisses if b >= 10) >= 3:
-            alerte = "⚠️ Alerte : trois tests ou plus ont baissé de ≥ 10%."
-
-        # --- IMC ---
-        if "imc" in agent_data.columns:
-            fig_imc, ax_imc = plt.subplots(figsize=(6, 3.5))
-            fig_imc.patch.set_facecolor("#1a1a1a")
-            ax_imc.set_facecolor("#1a1a1a")
-
-            imc_data = agent_data[["année", "imc"]].dropna().sort_values("année")
-            if not imc_data.empty:
-
-                def get_color_and_label(imc):
-                    if imc >= 40:
-                        return ("#8B0000", "Obésité massive")
-                    elif imc >= 35:
-                        return ("#FF4500", "Obésité sévère")
-                    elif imc >= 30:
-                        return ("#FFA500", "Obésité modérée")
-                    elif imc >= 25:
-                        return ("#FFD700", "Surpoids")
-                    else:
-                        return ("#32CD32", "Normal")
-
-                years = imc_data["année"]
-                values = imc_data["imc"]
-                colors = [get_color_and_label(val)[0] for val in values]
-                labels = [get_color_and_label(val)[1] for val in values]
-
-                scatter = ax_imc.scatter(
-                    years,
-                    values,
-                    c=colors,
-                    s=100,
-                    edgecolors="white",
-                    linewidths=1.5,
-                )
-
-                # Annotations des valeurs
-                for i, val in enumerate(values):
-                    ax_imc.annotate(
-                        f"{val:.1f}",
-                        (years.iloc[i], val),
-                        textcoords="offset points",
-                        xytext=(0, 6),
-                        ha="center",
-                        fontsize=9,
-                        color="white",
-                    )
-
-                # Légende personnalisée
-                from matplotlib.lines import Line2D
-
-                legend_elements = [
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label="Normal",
-                        markerfacecolor="#32CD32",
-                        markersize=9,
-                    ),
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label="Surpoids",
-                        markerfacecolor="#FFD700",
-                        markersize=9,
-                    ),
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label="Obésité modérée",
-                        markerfacecolor="#FFA500",
-                        markersize=9,
-                    ),
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label="Obésité sévère",
-                        markerfacecolor="#FF4500",
-                        markersize=9,
-                    ),
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label="Obésité massive",
-                        markerfacecolor="#8B0000",
-                        markersize=9,
-                    ),
-                ]
-                ax_imc.legend(
-                    handles=legend_elements,
-                    loc="best",
-                    facecolor="#2a2a2a",
-                    edgecolor="#444",
-                    labelcolor="white",
-                )
-
-                ax_imc.set_title("Évolution de l'IMC", color="white")
-                ax_imc.set_xlabel("Année", color="white")
-                ax_imc.set_ylabel("IMC", color="white")
-                ax_imc.tick_params(colors="white")
-                ax_imc.grid(True, linestyle="--", alpha=0.3)
-                fig_imc.tight_layout()
-                imc_chart = fig_to_base64(fig_imc)
-        else:
-            imc_chart = None
-
-        # --- Périmètre abdominal ---
-        if "périmétre abdominal" in agent_data.columns and "sexe" in agent_data.columns:
-            fig_tour, ax_tour = plt.subplots(figsize=(6, 3.5))
-            fig_tour.patch.set_facecolor("#1a1a1a")
-            ax_tour.set_facecolor("#1a1a1a")
-
-            tour_data = (
-                agent_data[["année", "périmétre abdominal"]]
-                .dropna()
-                .sort_values("année")
+        baisses_detaillees = fiche["baisses_detaillees"]
+        alerte = fiche["alerte"]
+
+        # --- Position dans la cohorte (sexe, tranche d'âge, catégorie, année) ---
+        percentiles = fiche["percentiles"]
+
+        with metrics.span("template"):
+            page = render_template(
+                "agent.html",
+                matricule=matricule,
+                grade=grade,
+                grade_image=grade_image,
+                poids=poids,
+                taille=taille,
+                localisation=localisation,
+                age=age,
+                categorie=categorie,
+                genre=genre,
+                charts=charts,
+                imc_chart=imc_chart,
+                tour_chart=tour_chart,
+                alerte=alerte,
+                baisses_detaillees=baisses_detaillees,
+                alertes_sante=alertes_sante,
+                alertes_sante_details=alertes_sante_details,
+                percentiles=percentiles,
             )
-            if not tour_data.empty:
-                sexe_data = agent_data["sexe"].dropna()
-                sexe = (
-                    sexe_data.iloc[-1].strip().lower()
-                    if not sexe_data.empty
-                    else "inconnu"
-                )
-                seuil = 94 if sexe == "homme" else 80
-
-                years = tour_data["année"]
-                values = tour_data["périmétre abdominal"]
-                colors = ["red" if val > seuil else "green" for val in values]
-
-                scatter = ax_tour.scatter(
-                    years,
-                    values,
-                    c=colors,
-                    s=100,
-                    edgecolors="white",
-                    linewidths=1.5,
-                )
-
-                for i, val in enumerate(values):
-                    ax_tour.annotate(
-                        f"{val:.1f}",
-                        (years.iloc[i], val),
-                        textcoords="offset points",
-                        xytext=(0, 6),
-                        ha="center",
-                        fontsize=9,
-                        color="white",
-                    )
-
-                from matplotlib.lines import Line2D
-
-                legend_elements = [
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label="Normal",
-                        markerfacecolor="green",
-                        markersize=9,
-                    ),
-                    Line2D(
-                        [0],
-                        [0],
-                        marker="o",
-                        color="w",
-                        label=f"Dépassé ({seuil} cm)",
-                        markerfacecolor="red",
-                        markersize=9,
-                    ),
-                ]
-                ax_tour.legend(
-                    handles=legend_elements,
-                    loc="best",
-                    facecolor="#2a2a2a",
-                    edgecolor="#444",
-                    labelcolor="white",
-                )
-
-                ax_tour.set_title("Tour de Taille", color="white")
-                ax_tour.set_xlabel("Année", color="white")
-                ax_tour.set_ylabel("cm", color="white")
-                ax_tour.tick_params(colors="white")
-                ax_tour.grid(True, linestyle="--", alpha=0.3)
-                fig_tour.tight_layout()
-                tour_chart = fig_to_base64(fig_tour)
-        else:
-            tour_chart = None
-
-        return render_template(
-            "agent.html",
-            matricule=matricule,
-            grade=grade,
-            grade_image=grade_image,
-            poids=poids,
-            taille=taille,
-            localisation=localisation,
-            age=age,
-            categorie=categorie,
-            genre=genre,
-            charts=charts,
-            imc_chart=imc_chart,
-            tour_chart=tour_chart,
-            alerte=alerte,
-            baisses_detaillees=baisses_detaillees,
-            alertes_sante=alertes_sante,
-            alertes_sante_details=alertes_sante_details,
-        )
+        return page
 
     return render_template("index.html", error=error)
 
 
-# Ajoute ceci dans app.py
+@app.route("/agent/<matricule>/chart/<kind>.<format>")
+@requires_auth
+def agent_chart(matricule, kind, format):
+    if format not in CHART_RENDERERS:
+        abort(404)
+    donnees = data_store.get()
+    agent_data = agent_rows(donnees.tables, donnees.index, matricule)
+    chart = None
+    if not agent_data.empty:
+        chart = agent_charts(agent_data, format).get(kind)
+    if chart is None:
+        abort(404)
+
+    version = agent_version(donnees, matricule, agent_data)
+    etag = f"{version}-{matricule}-{kind}-{format}"
+    if is_resource_modified(request.environ, etag=etag, last_modified=donnees.modified):
+        _, render, args = chart
+        response = Response(
+            render_chart(version, matricule, kind, render, *args, format=format),
+            mimetype=CHART_MIMETYPES[format],
+        )
+    else:
+        response = Response(status=304)
+
+    response.set_etag(etag)
+    response.last_modified = donnees.modified
+    response.cache_control.private = True
+    response.cache_control.max_age = 86400
+    return response
+
+
+# Colonnes de la liste des alertes (tableau et exports)
+ALERTES_COLONNES = ["matricule", "nombre", "types", *AFFECTATION_COLS]
+ALERTES_PAR_PAGE = 100
+PAR_PAGE_MAX = 500
+
+
+def alertes_demandees(donnees):
+    # Filtres et tri communs à /alertes et /api/alertes, sur la table précalculée
+    return filtrer_alertes(
+        donnees.alertes["liste"],
+        filtres={col: request.args.get(col, "").strip() for col in AFFECTATION_COLS},
+        type_alerte=request.args.get("type"),
+        tri=request.args.get("tri"),
+        desc=request.args.get("ordre") == "desc",
+    )
+
+
+def pagination(total, par_page_defaut):
+    par_page = request.args.get("par_page", par_page_defaut, type=int)
+    par_page = min(max(par_page, 1), PAR_PAGE_MAX)
+    pages = max((total + par_page - 1) // par_page, 1)
+    page = min(max(request.args.get("page", 1, type=int), 1), pages)
+    return page, par_page, pages
+
+
+def export_alertes(alertes, format):
+    # Réponse streamée : les lignes partent au fur et à mesure
+    if format == "ndjson":
+
+        def lignes():
+            for alerte in alertes:
+                valeurs = {col: alerte[col] for col in ALERTES_COLONNES}
+                yield json.dumps(valeurs, ensure_ascii=False) + "\n"
 
-from flask import jsonify
+        mimetype, extension = "application/x-ndjson", "ndjson"
+    else:
+
+        def lignes():
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            # En-tête envoyé seul : un export sans ligne reste un CSV valide
+            writer.writerow(ALERTES_COLONNES)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            for alerte in alertes:
+                writer.writerow([alerte[col] for col in ALERTES_COLONNES])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+
+        mimetype, extension = "text/csv", "csv"
+
+    return Response(
+        stream_with_context(lignes()),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=alertes.{extension}"},
+    )
 
 
 @app.route("/alertes")
+@requires_auth
 def alertes():
-    alertes_liste = []
-    matricules = df["matricule"].unique()
-
-    for mat in matricules:
-        agent_data = df[df["matricule"] == mat]
-        alertes_sante, _ = generate_alertes_sante_evolution(agent_data)
-
-        # Analyse tests physiques
-        baisses = []
-        for test in test_labels:
-            if test not in agent_data.columns:
-                continue
-            test_data = agent_data[["année", test]].dropna()
-            if test_data.empty:
-                continue
-            valeurs = test_data.set_index("année")[test]
-            valeurs = valeurs.loc[valeurs.index.isin(range(2019, 2025))]
-            if len(valeurs) < 2:
-                continue
-            val_max = valeurs.max()
-            val_recent = valeurs.sort_index().iloc[-1]
-            if val_max == 0:
-                continue
-            baisse_pct = ((val_max - val_recent) / val_max) * 100
-            baisses.append(baisse_pct)
-
-        types = []
-        if alertes_sante:
-            types.append("Santé")
-        if (
-            any(b >= 30 for b in baisses)
-            or sum(1 for b in baisses if b >= 20) >= 2
-            or sum(1 for b in baisses if b >= 10) >= 3
-        ):
-            types.append("Tests physiques")
-
-        if types:
-            alertes_liste.append(
-                {"matricule": mat, "nombre": len(types), "types": ", ".join(types)}
-            )
+    donnees = data_store.get()
+    liste = alertes_demandees(donnees)
+    format = request.args.get("format")
+    if format in ("csv", "ndjson"):
+        return export_alertes(liste, format)
+
+    page, par_page, pages = pagination(len(liste), ALERTES_PAR_PAGE)
+    debut = (page - 1) * par_page
+    toutes = donnees.alertes["liste"]
+    options = {
+        col: sorted({a[col] for a in toutes if a[col] is not None})
+        for col in AFFECTATION_COLS
+    }
+    arguments = {k: v for k, v in request.args.items() if k != "page"}
+    return render_template(
+        "alertes.html",
+        alertes=liste[debut : debut + par_page],
+        total=len(liste),
+        page=page,
+        pages=pages,
+        options=options,
+        types=TYPES_ALERTE,
+        filtres=request.args,
+        page_url=lambda n: url_for("alertes", **arguments, page=n),
+        export_url=lambda fmt: url_for("alertes", **arguments, format=fmt),
+    )
+
+
+# --- Tableau de bord des unités ---
+
+
+def unite_demandee():
+    # Chemin de l'unité : ?groupement=...&compagnie=...&cis=... (niveaux
+    # renseignés dans l'ordre) et année éventuelle
+    chemin = []
+    for niveau in NIVEAUX:
+        nom = request.args.get(niveau, "").strip()
+        if not nom:
+            break
+        chemin.append(nom)
+    return tuple(chemin), request.args.get("annee", type=int)
+
+
+def unite_url(chemin, annee=None):
+    return url_for("unites", **dict(zip(NIVEAUX, chemin)), annee=annee)
+
+
+@app.route("/unites")
+@requires_auth
+def unites():
+    donnees = data_store.get()
+    chemin, annee = unite_demandee()
+    with metrics.span("lookup"):
+        vue = drill_down(donnees.unites, chemin, test_labels, annee)
+    if vue is None:
+        abort(404)
+    return render_template("unites.html", vue=vue, chemin=chemin, unite_url=unite_url)
+
+
+# --- API JSON ---
+
+# Nombre maximum de matricules par appel groupé
+API_BATCH_MAX = 1000
+
 
-    return render_template("alertes.html", alertes=alertes_liste)
+def _matricules_demandes(valeurs):
+    # Matricules normalisés comme dans le formulaire ("30500", 30500 ou "30500.0")
+    matricules = []
+    for valeur in valeurs:
+        matricule = str(valeur).strip()
+        if matricule.endswith(".0"):
+            matricule = matricule[:-2]
+        matricules.append(matricule)
+    return matricules
+
+
+@app.route("/api/agents/<matricule>")
+@requires_auth
+def api_agent(matricule):
+    matricule = _matricules_demandes([matricule])[0]
+    fiche = fiches_agents(data_store.get(), [matricule]).get(matricule)
+    if fiche is None:
+        return jsonify(erreur=f"Matricule {matricule} non trouvé."), 404
+    return jsonify(fiche)
+
+
+@app.route("/api/agents", methods=["POST"])
+@requires_auth
+def api_agents():
+    corps = request.get_json(silent=True)
+    valeurs = corps.get("matricules") if isinstance(corps, dict) else None
+    # Matricules en texte ou en nombre entier (null, booléens, objets refusés)
+    if not isinstance(valeurs, list) or not all(
+        isinstance(v, (str, int)) and not isinstance(v, bool) for v in valeurs
+    ):
+        return jsonify(erreur='Corps attendu : {"matricules": [...]}'), 400
+    if len(valeurs) > API_BATCH_MAX:
+        return jsonify(erreur=f"{API_BATCH_MAX} matricules maximum par appel."), 400
+
+    matricules = _matricules_demandes(valeurs)
+    donnees = data_store.get()
+    fiches = fiches_agents(donnees, matricules)
+    return jsonify(
+        version=donnees.version,
+        agents=list(fiches.values()),
+        non_trouves=[m for m in dict.fromkeys(matricules) if m not in fiches],
+    )
+
+
+@app.route("/api/matricules")
+@requires_auth
+def api_matricules():
+    # Autocomplétion du formulaire : matricules commençant par `prefix`
+    prefixe = normalize_prefix(request.args.get("prefix", ""))
+    if not prefixe:
+        return jsonify(erreur="Paramètre prefix requis."), 400
+    limite = request.args.get("limit", SUGGESTIONS, type=int)
+    limite = min(max(limite, 1), SUGGESTIONS_MAX)
+    donnees = data_store.get()
+    with metrics.span("lookup"):
+        total, suggestions = search_matricules(donnees.recherche, prefixe, limite)
+    return jsonify(
+        version=donnees.version,
+        prefix=prefixe,
+        total=total,
+        matricules=suggestions,
+    )
+
+
+@app.route("/api/unites")
+@requires_auth
+def api_unites():
+    donnees = data_store.get()
+    chemin, annee = unite_demandee()
+    with metrics.span("lookup"):
+        vue = drill_down(donnees.unites, chemin, test_labels, annee)
+    if vue is None:
+        return jsonify(erreur="Unité ou année sans agent affecté."), 404
+    return jsonify(version=donnees.version, **vue)
+
+
+@app.route("/api/alertes")
+@requires_auth
+def api_alertes():
+    donnees = data_store.get()
+    liste = alertes_demandees(donnees)
+    page, par_page, pages = pagination(len(liste), 50)
+    debut = (page - 1) * par_page
+    return jsonify(
+        version=donnees.version,
+        page=page,
+        pages=pages,
+        par_page=par_page,
+        total=len(liste),
+        alertes=liste[debut : debut + par_page],
+    )
+
+
+@app.route("/version")
+@requires_auth
+def version():
+    # Version des données servies par ce worker
+    donnees = data_store.get()
+    return jsonify(
+        version=donnees.version,
+        modifie=donnees.modified.isoformat(),
+        mesures=len(donnees.tables.mesures),
+        affectations=len(donnees.tables.affectations),
+        agents=len(donnees.tables.agents),
+        worker=os.getpid(),
+    )
+
+
+@metrics.gauge
+def _jauges():
+    # Lues au moment du scrape : cache des graphiques et données servies
+    stats = chart_cache.stats()
+    donnees = data_store.current
+    jauges = [
+        ("chart_cache_hits_total", {}, stats["hits"]),
+        ("chart_cache_misses_total", {}, stats["misses"]),
+        ("chart_cache_bytes", {}, stats["bytes"]),
+        ("dataset_info", {"version": donnees.version}, 1),
+        ("dataset_agents", {}, len(donnees.tables.agents)),
+    ]
+    jauges += [
+        ("dataset_rows", {"table": nom}, len(table))
+        for nom, table in donnees.tables._asdict().items()
+    ]
+    if stats["entries"] is not None:
+        jauges.append(("chart_cache_entries", {}, stats["entries"]))
+    return jauges
+
+
+@app.route("/metrics")
+@requires_auth
+def metrics_prometheus():
+    if not metrics.enabled:
+        abort(404)
+    return Response(
+        metrics.render(worker=os.getpid()),
+        mimetype="text/plain; version=0.0.4",
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,51 @@
+"""RSS du processus pendant 1 000 rendus de graphiques.
+
+    python benchmarks/chart_memory.py [nombre_de_rendus]
+
+Avec le module charts (figures réutilisées, hors registre pyplot), la mémoire
+doit rester plate une fois les premières figures créées.
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+
+import app  # noqa: E402
+from charts import render_imc_chart, render_test_chart, render_tour_chart  # noqa: E402
+
+
+def rss_mo():
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def main(n=1000):
+    donnees = app.data_store.get()
+    matricules = list(donnees.index)
+    rendus = 0
+    palier = 0
+    debut = time.perf_counter()
+    print(f"{'rendus':>7} {'RSS (Mo)':>9}")
+    i = 0
+    while rendus < n:
+        if rendus >= palier:
+            print(f"{rendus:>7} {rss_mo():>9.1f}")
+            palier += n // 10
+        agent_data = app.agent_rows(donnees.tables, donnees.index, matricules[i])
+        i = (i + 1) % len(matricules)
+        for test, label in app.test_labels.items():
+            render_test_chart(agent_data, test, label, app.niveau_cols[test])
+        render_imc_chart(agent_data)
+        render_tour_chart(agent_data)
+        rendus += len(app.test_labels) + 2
+    print(f"{rendus:>7} {rss_mo():>9.1f}")
+    duree = time.perf_counter() - debut
+    print(f"{rendus} rendus en {duree:.1f} s ({duree / rendus * 1000:.1f} ms/rendu)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,106 @@
+"""Données et mémoire vues par chaque worker gunicorn.
+
+    python benchmarks/gunicorn_workers.py [workers]
+
+Lance gunicorn avec et sans préchargement (GUNICORN_PRELOAD), interroge
+/version jusqu'à avoir obtenu une réponse de chaque worker, vérifie qu'ils
+servent tous la même version des données et affiche leur mémoire
+(RSS, PSS et pages partagées, lues dans /proc/<pid>/smaps_rollup).
+"""
+
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+RACINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+AUTH = "Basic " + base64.b64encode(b"demo:1234").decode()
+
+
+def port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def version(port):
+    req = urllib.request.Request(
+        f"http://127.0.0.1:{port}/version", headers={"Authorization": AUTH}
+    )
+    # Connexion neuve à chaque appel pour tomber sur différents workers
+    with urllib.request.urlopen(req, timeout=5) as r:
+        return json.load(r)
+
+
+def memoire_ko(pid):
+    valeurs = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for ligne in f:
+            champs = ligne.split()
+            if len(champs) == 3 and champs[2] == "kB":
+                valeurs[champs[0].rstrip(":")] = int(champs[1])
+    partage = valeurs.get("Shared_Clean", 0) + valeurs.get("Shared_Dirty", 0)
+    return valeurs.get("Rss", 0), valeurs.get("Pss", 0), partage
+
+
+def mesurer(workers, preload):
+    port = port_libre()
+    env = dict(os.environ, GUNICORN_PRELOAD="1" if preload else "0")
+    serveur = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            "gunicorn.conf.py",
+            "-w",
+            str(workers),
+            "-b",
+            f"127.0.0.1:{port}",
+            "app:app",
+        ],
+        cwd=RACINE,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        reponses = {}
+        limite = time.time() + 120
+        while len(reponses) < workers and time.time() < limite:
+            try:
+                v = version(port)
+            except OSError:
+                time.sleep(0.2)
+                continue
+            reponses[v["worker"]] = v
+
+        versions = {(v["version"], v["mesures"]) for v in reponses.values()}
+        mode = "préchargé" if preload else "par worker"
+        print(f"\n{mode} : {len(reponses)}/{workers} workers ont répondu")
+        print(f"versions servies : {sorted(versions)}")
+        if len(versions) != 1 or len(reponses) != workers:
+            raise SystemExit("ÉCHEC : les workers ne servent pas les mêmes données")
+
+        print(f"{'pid':>8} {'RSS (Mo)':>9} {'PSS (Mo)':>9} {'partagé (Mo)':>13}")
+        total_pss = 0
+        for pid in sorted(reponses):
+            rss, pss, partage = memoire_ko(pid)
+            total_pss += pss
+            print(
+                f"{pid:>8} {rss / 1024:>9.1f} {pss / 1024:>9.1f} {partage / 1024:>13.1f}"
+            )
+        print(f"PSS total des workers : {total_pss / 1024:.1f} Mo")
+    finally:
+        serveur.terminate()
+        serveur.wait()
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    mesurer(n, preload=False)
+    mesurer(n, preload=True)
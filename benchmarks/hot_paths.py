@@ -0,0 +1,305 @@
+"""Temps des chemins chauds de l'application, à plusieurs tailles de données.
+
+    python benchmarks/hot_paths.py [--echelles 1 10 100] [--repetitions 5]
+                                   [--json resultats.json] [--compare reference.json]
+
+Pour chaque échelle (1 = dataset_corrige.csv, 10 et 100 = données synthétiques
+de benchmarks/synthetic_data.py), mesure : chargement et nettoyage du CSV,
+instantané binaire, calcul des alertes et des cohortes, cube des unités et
+sa consultation (vue d'une unité à chaque niveau, API et tableau de bord),
+recherche d'un agent, autocomplétion des matricules (index, recherche par
+préfixe et requête), rendu de chaque graphique (PNG + base64, comme
+fig_to_base64) et des graphiques SVG d'un agent, alertes santé d'un agent
+(analyse_sante), POST / complet (client de test Flask), page
+agent avec ses graphiques PNG ou SVG (demandés un par un, ou rendus en
+parallèle par chart_pool et intégrés à la page), et la page /alertes (HTML
+paginé et export CSV complet).
+
+Affiche la médiane et le minimum en ms. --json enregistre les résultats ;
+--compare signale (code de sortie 1) les mesures dont la médiane dépasse
+--seuil fois celle du fichier de référence.
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+
+import app  # noqa: E402
+from alert_engine import analyse_sante, build_alert_table  # noqa: E402
+from chart_cache import ChartCache  # noqa: E402
+from chart_pool import ChartPool  # noqa: E402
+from cohorts import build_cohorts  # noqa: E402
+from dataset import (  # noqa: E402
+    DatasetStore,
+    agent_rows,
+    load_dataset_cached,
+    load_tables,
+    source_key,
+    subset_tables,
+)
+from matricule_search import build_matricule_search, search_matricules  # noqa: E402
+from rollups import NIVEAUX, build_rollups, drill_down  # noqa: E402
+from synthetic_data import SOURCE, generer  # noqa: E402
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"demo:1234").decode()}
+
+
+def mesurer(fn, repetitions):
+    # fn(i) est appelée une fois pour chauffer, puis `repetitions` fois
+    fn(0)
+    durees = []
+    for i in range(repetitions):
+        debut = time.perf_counter()
+        fn(i)
+        durees.append((time.perf_counter() - debut) * 1000)
+    return {"n": repetitions, "mediane": statistics.median(durees), "min": min(durees)}
+
+
+def scenarios(csv, echantillon):
+    """(nom, fonction(i), répétitions max) pour un fichier de données."""
+    client = app.app.test_client()
+    donnees = app.data_store.current
+    agents = [agent_rows(donnees.tables, donnees.index, m) for m in echantillon]
+
+    def agent(i):
+        return echantillon[i % len(echantillon)]
+
+    yield "chargement + nettoyage", lambda i: load_tables(csv), 3
+    cle = source_key(csv)
+    yield "instantané binaire", lambda i: load_dataset_cached(csv, cle), None
+    yield (
+        "calcul des alertes",
+        lambda i: build_alert_table(donnees.tables, app.test_labels),
+        3,
+    )
+    yield (
+        "calcul des cohortes",
+        lambda i: build_cohorts(donnees.tables, list(app.test_labels)),
+        3,
+    )
+    yield (
+        "cube des unités",
+        lambda i: build_rollups(donnees.tables, donnees.alertes, app.niveau_cols),
+        3,
+    )
+
+    # Unités consultées : l'ensemble, puis chaque niveau de la première branche
+    chemins = [()]
+    while len(chemins[-1]) < 3 and donnees.unites.enfants.get(chemins[-1]):
+        chemins.append((*chemins[-1], donnees.unites.enfants[chemins[-1]][0]))
+    requetes = [
+        "/unites?" + urlencode(dict(zip(NIVEAUX, chemin))) for chemin in chemins
+    ]
+
+    yield (
+        "vue d'une unité (cube)",
+        lambda i: drill_down(
+            donnees.unites, chemins[i % len(chemins)], app.test_labels
+        ),
+        None,
+    )
+    yield (
+        "GET /api/unites",
+        lambda i: client.get(
+            "/api" + requetes[i % len(requetes)], headers=AUTH
+        ).get_data(),
+        None,
+    )
+    yield (
+        "GET /unites (tableau de bord)",
+        lambda i: client.get(requetes[i % len(requetes)], headers=AUTH).get_data(),
+        None,
+    )
+    yield (
+        "recherche d'un agent",
+        lambda i: agent_rows(donnees.tables, donnees.index, agent(i)),
+        None,
+    )
+    yield (
+        "index d'autocomplétion",
+        lambda i: build_matricule_search(
+            donnees.tables, donnees.index, donnees.affectations_index
+        ),
+        3,
+    )
+
+    # Préfixes de 1 à 4 caractères des matricules échantillonnés
+    prefixes = [m[: 1 + i % 4] for i, m in enumerate(echantillon)]
+
+    def prefixe(i):
+        return prefixes[i % len(prefixes)]
+
+    yield (
+        "autocomplétion (recherche)",
+        lambda i: search_matricules(donnees.recherche, prefixe(i)),
+        None,
+    )
+    yield (
+        "GET /api/matricules",
+        lambda i: client.get(
+            f"/api/matricules?prefix={prefixe(i)}", headers=AUTH
+        ).get_data(),
+        None,
+    )
+
+    for kind in [*map(app.chart_kind, app.test_labels), "imc", "tour"]:
+        graphiques = [
+            app.agent_charts(a)[kind] for a in agents if kind in app.agent_charts(a)
+        ]
+        if not graphiques:
+            continue
+
+        def rendu(i, graphiques=graphiques):
+            _, render, args = graphiques[i % len(graphiques)]
+            return base64.b64encode(render(*args)).decode("utf-8")
+
+        yield f"graphique {kind} (PNG + base64)", rendu, None
+
+    def rendus_svg(i):
+        graphiques = app.agent_charts(agents[i % len(agents)], "svg")
+        for _, render, args in graphiques.values():
+            render(*args)
+
+    yield "8 graphiques SVG d'un agent", rendus_svg, None
+
+    yield (
+        "alertes santé d'un agent",
+        lambda i: analyse_sante(
+            subset_tables(
+                donnees.tables, donnees.index, donnees.affectations_index, [agent(i)]
+            )
+        ),
+        None,
+    )
+
+    def post_index(i):
+        reponse = client.post("/", data={"matricule": agent(i)}, headers=AUTH)
+        assert reponse.status_code == 200
+        return reponse
+
+    yield "POST / (fiche agent)", post_index, None
+
+    def page_agent(i, format="png"):
+        matricule = agent(i)
+        post_index(i)
+        for kind in app.agent_charts(agents[i % len(agents)]):
+            url = f"/agent/{matricule}/chart/{kind}.{format}"
+            assert client.get(url, headers=AUTH).status_code == 200
+
+    yield "page agent + graphiques", page_agent, None
+    yield (
+        "page agent + graphiques SVG",
+        lambda i: page_agent(i, "svg"),
+        None,
+    )
+
+    # Graphiques rendus en parallèle et intégrés à la page (CHART_RENDER_WORKERS)
+    pool = ChartPool(max(2, os.cpu_count() or 1))
+
+    def page_concurrente(i):
+        precedent, app.chart_pool = app.chart_pool, pool
+        try:
+            post_index(i)
+        finally:
+            app.chart_pool = precedent
+
+    yield (
+        f"page agent parallèle ({pool.workers} proc.)",
+        page_concurrente,
+        None,
+    )
+    pool.shutdown()
+
+    yield (
+        "GET /alertes (page HTML)",
+        lambda i: client.get("/alertes", headers=AUTH).get_data(),
+        None,
+    )
+    yield (
+        "GET /alertes?format=csv",
+        lambda i: client.get("/alertes?format=csv", headers=AUTH).get_data(),
+        None,
+    )
+
+
+def executer(echelle, repetitions, nb_agents):
+    csv = SOURCE if echelle == 1 else generer(echelle)
+    debut = time.perf_counter()
+    # Les routes lisent app.data_store : on y installe le jeu de données mesuré,
+    # sans cache de graphiques (max_bytes=0) pour mesurer de vrais rendus
+    app.data_store = DatasetStore(csv, app.charger_donnees, check_interval=1e9)
+    app.chart_cache = ChartCache(max_bytes=0)
+    donnees = app.data_store.current
+    print(
+        f"\n=== x{echelle} : {len(donnees.tables.mesures)} mesures, "
+        f"{len(donnees.index)} agents "
+        f"(préparation {time.perf_counter() - debut:.1f} s) ==="
+    )
+    echantillon = random.Random(0).sample(
+        list(donnees.index), min(nb_agents, len(donnees.index))
+    )
+
+    resultats = {}
+    print(f"{'mesure':<36} {'n':>3} {'médiane (ms)':>13} {'min (ms)':>10}")
+    for nom, fn, maximum in scenarios(csv, echantillon):
+        r = mesurer(fn, min(repetitions, maximum or repetitions))
+        resultats[nom] = r
+        print(f"{nom:<36} {r['n']:>3} {r['mediane']:>13.2f} {r['min']:>10.2f}")
+    return resultats
+
+
+def comparer(resultats, reference, seuil):
+    regressions = []
+    print(f"\n{'échelle':<8} {'mesure':<36} {'réf. (ms)':>10} {'ms':>10} {'ratio':>6}")
+    for echelle, mesures in resultats.items():
+        for nom, r in mesures.items():
+            ref = reference.get(echelle, {}).get(nom)
+            if not ref:
+                continue
+            ratio = r["mediane"] / ref["mediane"]
+            marque = "  <-- régression" if ratio > seuil else ""
+            if marque:
+                regressions.append((echelle, nom))
+            print(
+                f"{echelle:<8} {nom:<36} {ref['mediane']:>10.2f} "
+                f"{r['mediane']:>10.2f} {ratio:>5.2f}x{marque}"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks des chemins chauds")
+    parser.add_argument("--echelles", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--agents", type=int, default=20, help="agents échantillonnés")
+    parser.add_argument("--json", help="fichier où enregistrer les résultats")
+    parser.add_argument("--compare", help="résultats de référence (--json)")
+    parser.add_argument("--seuil", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    resultats = {
+        f"x{e}": executer(e, args.repetitions, args.agents) for e in args.echelles
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = comparer(resultats, json.load(f), args.seuil)
+        if regressions:
+            raise SystemExit(
+                f"{len(regressions)} régression(s) au-delà de {args.seuil}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
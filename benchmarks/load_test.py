@@ -0,0 +1,419 @@
+"""Test de charge de l'application servie par gunicorn, en local.
+
+    python benchmarks/load_test.py [--workers 2] [--threads 1] [--clients 8]
+                                   [--duree 30] [--chauffe 5] [--melange ...]
+                                   [--json resultats.json] [--compare ref.json]
+
+Lance gunicorn (gunicorn.conf.py, avec les variables d'environnement
+courantes : CHART_FORMAT, CHART_RENDER_WORKERS, GUNICORN_PRELOAD...) avec le
+nombre de workers et de threads demandé, puis `--clients` clients simulés
+enchaînent des requêtes tirées selon `--melange` :
+
+- fiche : POST / pour un matricule réel du dataset, suivi du chargement des
+  images de la page (graphiques et grade) comme le ferait le navigateur
+  (sauf --sans-images) ;
+- alertes : GET /alertes, première page ou une des suivantes ;
+- grade : GET d'une image de static/grades.
+
+Les requêtes de la période de chauffe ne sont pas comptées. Affiche le
+débit, les latences p50 / p95 / p99 et le taux d'erreurs par type de requête,
+ainsi que le débit et la RSS de chaque worker au fil du test. --json
+enregistre les résultats ; --compare les met en regard d'un fichier de
+référence obtenu sur la même machine.
+"""
+
+import argparse
+import base64
+import csv
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import quote, unquote, urlencode
+
+from gunicorn_workers import memoire_ko, port_libre
+
+RACINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+AUTH = "Basic " + base64.b64encode(b"demo:1234").decode()
+
+MELANGE = "fiche=5,alertes=2,grade=3"
+# Images locales d'une page agent (graphiques servis à part, image du grade)
+IMAGES = re.compile(r'<img[^>]+src="(/[^"]+)"')
+ALERTES_PAGES = 5
+
+
+def matricules_reels(path):
+    # Matricules du CSV, normalisés comme par load_dataset ("30500.0" -> "30500")
+    with open(path, newline="", encoding="utf-8") as f:
+        lecteur = csv.reader(f)
+        colonne = next(lecteur).index("matricule")
+        valeurs = {ligne[colonne].strip().replace(".0", "") for ligne in lecteur}
+    return sorted(v for v in valeurs if v)
+
+
+def images_grade():
+    return sorted(os.listdir(os.path.join(RACINE, "static", "grades")))
+
+
+def lire_melange(texte):
+    poids = {}
+    for element in texte.split(","):
+        nom, _, valeur = element.partition("=")
+        if nom.strip() not in ("fiche", "alertes", "grade"):
+            raise SystemExit(f"Type de requête inconnu dans --melange : {nom}")
+        poids[nom.strip()] = float(valeur)
+    return poids
+
+
+def pids_workers(maitre):
+    # Processus dont le parent est le maître gunicorn
+    pids = []
+    for nom in os.listdir("/proc"):
+        if not nom.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nom}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # Le nom du processus (2e champ) peut contenir des espaces
+        if int(stat.rsplit(")", 1)[1].split()[1]) == maitre:
+            pids.append(int(nom))
+    return sorted(pids)
+
+
+class Serveur:
+    """gunicorn lancé sur un port libre, arrêté à la sortie du bloc with."""
+
+    def __init__(self, workers, threads):
+        self.workers = workers
+        self.threads = threads
+        self.port = port_libre()
+        self.journal = tempfile.TemporaryFile()
+
+    def __enter__(self):
+        self.processus = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "gunicorn",
+                "-c",
+                "gunicorn.conf.py",
+                "-w",
+                str(self.workers),
+                "--threads",
+                str(self.threads),
+                "-b",
+                f"127.0.0.1:{self.port}",
+                "app:app",
+            ],
+            cwd=RACINE,
+            stdout=self.journal,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            self._attendre()
+        except BaseException:
+            self.__exit__()
+            raise
+        return self
+
+    def _attendre(self, delai=180):
+        # Prêt quand tous les workers sont lancés et qu'une requête aboutit
+        limite = time.time() + delai
+        while time.time() < limite:
+            if self.processus.poll() is not None:
+                self.journal.seek(0)
+                sys.stderr.write(self.journal.read().decode(errors="replace"))
+                raise SystemExit("gunicorn s'est arrêté au démarrage")
+            if len(pids_workers(self.processus.pid)) >= self.workers:
+                try:
+                    connexion = http.client.HTTPConnection("127.0.0.1", self.port)
+                    connexion.request(
+                        "GET", "/version", headers={"Authorization": AUTH}
+                    )
+                    if connexion.getresponse().status == 200:
+                        return
+                except OSError:
+                    pass
+            time.sleep(0.2)
+        raise SystemExit(f"gunicorn ne répond pas après {delai} s")
+
+    def __exit__(self, *exc):
+        self.processus.terminate()
+        self.processus.wait()
+        self.journal.close()
+
+
+class Client(threading.Thread):
+    """Client simulé : une connexion, des requêtes tirées au hasard."""
+
+    def __init__(self, numero, port, poids, matricules, grades, images, fin):
+        super().__init__(daemon=True)
+        self.hasard = random.Random(numero)
+        self.port = port
+        self.actions = list(poids)
+        self.poids = list(poids.values())
+        self.matricules = matricules
+        self.grades = grades
+        self.images = images
+        self.fin = fin
+        # (instant de fin, type, latence en s, erreur : statut HTTP ou exception)
+        self.mesures = []
+
+    def requete(self, type_, methode, url, corps=None, en_tetes=None):
+        en_tetes = {"Authorization": AUTH, **(en_tetes or {})}
+        debut = time.perf_counter()
+        erreur = None
+        contenu = b""
+        try:
+            self.connexion.request(methode, url, body=corps, headers=en_tetes)
+            reponse = self.connexion.getresponse()
+            contenu = reponse.read()
+            if reponse.status >= 400:
+                erreur = str(reponse.status)
+        except (OSError, http.client.HTTPException) as exc:
+            erreur = type(exc).__name__
+            self.connexion.close()
+        fin = time.perf_counter()
+        self.mesures.append((fin, type_, fin - debut, erreur))
+        return contenu
+
+    def fiche(self):
+        page = self.requete(
+            "POST /",
+            "POST",
+            "/",
+            urlencode({"matricule": self.hasard.choice(self.matricules)}),
+            {"Content-Type": "application/x-www-form-urlencoded"},
+        )
+        if self.images:
+            for url in IMAGES.findall(page.decode("utf-8", errors="replace")):
+                url = quote(unquote(url.replace("&amp;", "&")), safe="/?&=")
+                type_ = "graphique" if "/chart/" in url else "image de grade"
+                self.requete(type_, "GET", url)
+
+    def alertes(self):
+        page = self.hasard.randint(1, ALERTES_PAGES)
+        self.requete("GET /alertes", "GET", f"/alertes?page={page}")
+
+    def grade(self):
+        image = self.hasard.choice(self.grades)
+        self.requete("image de grade", "GET", f"/static/grades/{quote(image)}")
+
+    def run(self):
+        self.connexion = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        while time.perf_counter() < self.fin:
+            action = self.hasard.choices(self.actions, self.poids)[0]
+            getattr(self, action)()
+        self.connexion.close()
+
+
+def centile(triees, p):
+    # Rang le plus proche, sur des valeurs triées
+    if not triees:
+        return None
+    return triees[min(len(triees) - 1, max(0, round(p / 100 * len(triees)) - 1))]
+
+
+def statistiques(mesures, duree):
+    latences = sorted(latence for _, _, latence, _ in mesures)
+    erreurs = {}
+    for _, _, _, erreur in mesures:
+        if erreur is not None:
+            erreurs[erreur] = erreurs.get(erreur, 0) + 1
+    return {
+        "requetes": len(mesures),
+        "debit": len(mesures) / duree,
+        "erreurs": 100 * sum(erreurs.values()) / len(mesures) if mesures else 0.0,
+        "detail_erreurs": erreurs,
+        **{f"p{p}": (centile(latences, p) or 0) * 1000 for p in (50, 95, 99)},
+        "max": (latences[-1] if latences else 0) * 1000,
+    }
+
+
+def suivre_memoire(maitre, arret, intervalle, releves):
+    # RSS (Mo) de chaque worker toutes les `intervalle` s
+    debut = time.perf_counter()
+    while not arret.wait(intervalle):
+        instant = time.perf_counter() - debut
+        rss = {}
+        for pid in pids_workers(maitre):
+            try:
+                rss[pid] = memoire_ko(pid)[0] / 1024
+            except OSError:
+                continue
+        releves.append((instant, rss))
+
+
+def executer(args):
+    poids = lire_melange(args.melange)
+    matricules = matricules_reels(os.path.join(RACINE, "dataset_corrige.csv"))
+    grades = images_grade()
+
+    with Serveur(args.workers, args.threads) as serveur:
+        maitre = serveur.processus.pid
+        print(
+            f"gunicorn : {args.workers} worker(s) x {args.threads} thread(s), "
+            f"{args.clients} clients, {args.duree} s (+ {args.chauffe} s de "
+            f"chauffe), mélange {args.melange}, {len(matricules)} matricules"
+        )
+        debut = time.perf_counter()
+        debut_mesure = debut + args.chauffe
+        fin = debut_mesure + args.duree
+        clients = [
+            Client(
+                i, serveur.port, poids, matricules, grades, not args.sans_images, fin
+            )
+            for i in range(args.clients)
+        ]
+        arret = threading.Event()
+        releves = []
+        suivi = threading.Thread(
+            target=suivre_memoire,
+            args=(maitre, arret, args.intervalle, releves),
+            daemon=True,
+        )
+        suivi.start()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        arret.set()
+        suivi.join()
+
+    mesures = [
+        (instant - debut_mesure, *reste)
+        for client in clients
+        for instant, *reste in client.mesures
+        if debut_mesure <= instant <= fin
+    ]
+    types = sorted({type_ for _, type_, _, _ in mesures})
+    resultats = {
+        "configuration": {
+            "workers": args.workers,
+            "threads": args.threads,
+            "clients": args.clients,
+            "duree": args.duree,
+            "melange": args.melange,
+            "images": not args.sans_images,
+        },
+        "total": statistiques(mesures, args.duree),
+        "par_type": {
+            type_: statistiques([m for m in mesures if m[1] == type_], args.duree)
+            for type_ in types
+        },
+        "chronologie": chronologie(
+            mesures, releves, args.chauffe, args.duree, args.intervalle
+        ),
+    }
+    return resultats
+
+
+def chronologie(mesures, releves, chauffe, duree, intervalle):
+    # Débit et RSS des workers par intervalle, de la fin de la chauffe à la
+    # fin de la mesure (les dernières requêtes en cours ne sont pas comptées)
+    lignes = []
+    for instant, rss in releves:
+        instant -= chauffe
+        if not intervalle <= instant <= duree:
+            continue
+        requetes = sum(instant - intervalle < t <= instant for t, _, _, _ in mesures)
+        lignes.append(
+            {
+                "t": round(instant, 1),
+                "debit": requetes / intervalle,
+                "rss": {str(pid): round(mo, 1) for pid, mo in rss.items()},
+            }
+        )
+    return lignes
+
+
+def afficher(resultats):
+    entete = (
+        f"{'requêtes':<16} {'n':>7} {'req/s':>8} {'erreurs':>8} "
+        f"{'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9}  détail"
+    )
+    print("\n" + entete)
+    lignes = [*resultats["par_type"].items(), ("total", resultats["total"])]
+    for nom, s in lignes:
+        print(
+            f"{nom:<16} {s['requetes']:>7} {s['debit']:>8.1f} "
+            f"{s['erreurs']:>7.1f}% {s['p50']:>9.1f} {s['p95']:>9.1f} "
+            f"{s['p99']:>9.1f} {s['max']:>9.1f}  "
+            + ", ".join(f"{n} x {e}" for e, n in sorted(s["detail_erreurs"].items()))
+        )
+
+    chronologie = resultats["chronologie"]
+    if chronologie:
+        pids = sorted({pid for ligne in chronologie for pid in ligne["rss"]}, key=int)
+        print(
+            f"\n{'t (s)':>6} {'req/s':>8} "
+            + " ".join(f"{'RSS ' + pid:>12}" for pid in pids)
+            + "   (Mo)"
+        )
+        for ligne in chronologie:
+            rss = " ".join(
+                f"{ligne['rss'][pid]:>12.1f}" if pid in ligne["rss"] else f"{'-':>12}"
+                for pid in pids
+            )
+            print(f"{ligne['t']:>6.1f} {ligne['debit']:>8.1f} {rss}")
+
+
+def comparer(resultats, reference):
+    print(
+        f"\n{'requêtes':<16} {'req/s réf.':>10} {'req/s':>8} "
+        f"{'p95 réf.':>9} {'p95':>9}"
+    )
+    actuels = {**resultats["par_type"], "total": resultats["total"]}
+    references = {**reference["par_type"], "total": reference["total"]}
+    for nom, s in actuels.items():
+        ref = references.get(nom)
+        if ref is None:
+            continue
+        print(
+            f"{nom:<16} {ref['debit']:>10.1f} {s['debit']:>8.1f} "
+            f"{ref['p95']:>9.1f} {s['p95']:>9.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge sous gunicorn")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--clients", type=int, default=8, help="clients simultanés")
+    parser.add_argument("--duree", type=float, default=30, help="durée mesurée (s)")
+    parser.add_argument("--chauffe", type=float, default=5, help="non comptée (s)")
+    parser.add_argument(
+        "--melange", default=MELANGE, help=f"poids des requêtes (défaut {MELANGE})"
+    )
+    parser.add_argument(
+        "--sans-images",
+        action="store_true",
+        help="ne pas charger les images des pages agent",
+    )
+    parser.add_argument(
+        "--intervalle", type=float, default=2, help="relevé de la RSS (s)"
+    )
+    parser.add_argument("--json", help="fichier où enregistrer les résultats")
+    parser.add_argument("--compare", help="résultats de référence (--json)")
+    args = parser.parse_args(argv)
+
+    resultats = executer(args)
+    afficher(resultats)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultats, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            comparer(resultats, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Débit du générateur de fiches (report.py) selon le nombre de workers.
+
+    python benchmarks/report_throughput.py [agents] [workers ...]
+
+Génère les mêmes fiches PDF dans un répertoire temporaire neuf pour chaque
+nombre de workers (par défaut 1, 2, 4 ... jusqu'au nombre de cœurs) et affiche
+le débit en agents/s et l'accélération par rapport à un seul worker.
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.chdir(os.path.join(os.path.dirname(__file__), ".."))
+
+import app  # noqa: E402
+import report  # noqa: E402
+
+
+def paliers():
+    coeurs = os.cpu_count() or 1
+    n, valeurs = 1, []
+    while n < coeurs:
+        valeurs.append(n)
+        n *= 2
+    return valeurs + [coeurs]
+
+
+def main(n=100, workers=None):
+    donnees = app.data_store.current
+    matricules = list(donnees.index)[:n]
+    print(f"{len(matricules)} agents, {os.cpu_count()} cœur(s)")
+    print(f"{'workers':>7} {'durée (s)':>10} {'agents/s':>9} {'accél.':>7}")
+    reference = None
+    for w in workers or paliers():
+        with tempfile.TemporaryDirectory() as out:
+            ecrits, duree = report.generer(donnees, matricules, out, "pdf", w)
+        debit = ecrits / duree
+        reference = reference or debit
+        print(f"{w:>7} {duree:>10.1f} {debit:>9.2f} {debit / reference:>6.2f}x")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    main(n, [int(w) for w in sys.argv[2:]] or None)
@@ -0,0 +1,56 @@
+"""Jeu de données synthétique : dataset_corrige.csv multiplié par un facteur.
+
+    python benchmarks/synthetic_data.py <facteur> [sortie.csv]
+
+La copie k (k = 0 ... facteur-1) reprend toutes les lignes d'origine avec des
+matricules décalés de k × 10^n (n = nombre de chiffres du plus grand matricule),
+si bien que le fichier contient facteur fois plus d'agents avec la même
+distribution de tests, d'alertes et d'affectations. Les cellules sont recopiées
+telles quelles (même format que le CSV d'origine). Le résultat est
+déterministe : un fichier déjà généré pour le même facteur est réutilisé.
+"""
+
+import math
+import os
+import sys
+
+import pandas as pd
+
+RACINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SOURCE = os.path.join(RACINE, "dataset_corrige.csv")
+
+
+def chemin_synthetique(facteur, repertoire=None):
+    repertoire = repertoire or os.path.join(RACINE, "benchmarks", "data")
+    return os.path.join(repertoire, f"dataset_x{facteur}.csv")
+
+
+def generer(facteur, sortie=None, source=SOURCE):
+    """Écrit (si besoin) le CSV agrandi `facteur` fois et renvoie son chemin."""
+    sortie = sortie or chemin_synthetique(facteur)
+    if os.path.exists(sortie):
+        return sortie
+    os.makedirs(os.path.dirname(os.path.abspath(sortie)), exist_ok=True)
+
+    base = pd.read_csv(source, dtype=str, keep_default_na=False)
+    matricules = pd.to_numeric(base["matricule"], errors="coerce")
+    pas = 10 ** math.ceil(math.log10(matricules.max() + 1))
+    index_col = base.columns[0] if base.columns[0].startswith("Unnamed") else None
+
+    tmp = f"{sortie}.{os.getpid()}.tmp"
+    for k in range(facteur):
+        copie = base.copy()
+        decales = matricules + k * pas
+        copie["matricule"] = decales.map("{:.1f}".format).where(
+            matricules.notna(), base["matricule"]
+        )
+        if index_col:
+            copie[index_col] = range(k * len(base), (k + 1) * len(base))
+        copie.to_csv(tmp, mode="w" if k == 0 else "a", header=k == 0, index=False)
+    os.replace(tmp, sortie)
+    return sortie
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(generer(n, sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Formats stockés sur disque (dernier élément de la clé), un par extension
+FORMATS = ("png", "svg")
+
+
+class ChartCache:
+    """Cache LRU des graphiques rendus (PNG ou SVG), borné en octets.
+
+    Les clés sont des tuples (matricule, type de graphique, empreinte des
+    lignes de l'agent, format).
+    Avec `directory`, les graphiques sont stockés sur disque (un fichier
+    <empreinte de la clé>.<format>) et partagés entre les workers gunicorn ;
+    sinon ils restent en mémoire dans le processus.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._size = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._size = sum(taille for _, taille, _ in self._fichiers())
+
+    def get(self, key):
+        if self.directory:
+            data = self._lire(key)
+        else:
+            with self._lock:
+                data = self._items.get(key)
+                if data is not None:
+                    self._items.move_to_end(key)
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        if self.directory:
+            self._ecrire(key, data)
+            return
+        with self._lock:
+            ancien = self._items.pop(key, None)
+            if ancien is not None:
+                self._size -= len(ancien)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, retire = self._items.popitem(last=False)
+                self._size -= len(retire)
+
+    def get_or_render(self, key, render):
+        data = self.get(key)
+        if data is None:
+            data = render()
+            if data is not None:
+                self.put(key, data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": self._size,
+                "entries": len(self._items) if not self.directory else None,
+            }
+
+    # --- stockage disque ---
+
+    def _chemin(self, key):
+        nom = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{nom}.{key[-1]}")
+
+    def _lire(self, key):
+        chemin = self._chemin(key)
+        try:
+            with open(chemin, "rb") as f:
+                data = f.read()
+            # L'heure de modification sert d'ordre LRU entre les workers
+            os.utime(chemin)
+        except OSError:
+            return None
+        return data
+
+    def _ecrire(self, key, data):
+        chemin = self._chemin(key)
+        tmp = f"{chemin}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, chemin)
+        except OSError:
+            return
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._elaguer()
+
+    def _fichiers(self):
+        fichiers = []
+        with os.scandir(self.directory) as entrees:
+            for entree in entrees:
+                if entree.name.rsplit(".", 1)[-1] in FORMATS:
+                    try:
+                        st = entree.stat()
+                    except OSError:
+                        continue
+                    fichiers.append((st.st_mtime, st.st_size, entree.path))
+        return fichiers
+
+    def _elaguer(self):
+        # Rescan du répertoire (d'autres workers y écrivent aussi), puis
+        # suppression des fichiers les moins récemment utilisés
+        fichiers = sorted(self._fichiers())
+        self._size = sum(taille for _, taille, _ in fichiers)
+        for _, taille, chemin in fichiers:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(chemin)
+            except OSError:
+                continue
+            self._size -= taille
@@ -0,0 +1,66 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _contexte():
+    # forkserver : les processus de rendu ne sont pas forkés depuis un worker
+    # qui peut avoir des threads en cours (rechargement des données)
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        contexte = multiprocessing.get_context("forkserver")
+        contexte.set_forkserver_preload(["charts", "charts_svg"])
+        return contexte
+    return multiprocessing.get_context("spawn")
+
+
+class ChartPool:
+    """Pool de processus qui rend en parallèle les graphiques d'une requête.
+
+    Avec `workers` = 0 le pool est désactivé. Il est créé à la première
+    utilisation, dans le processus qui sert la requête (donc après le fork
+    des workers gunicorn), et recréé s'il a été cassé. Les tâches envoyées
+    sont (fonction de rendu, arguments) : les lignes de l'agent sont
+    sérialisées avec chaque tâche, les processus n'ont pas besoin du dataset.
+    """
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=_contexte())
+                self._pid = os.getpid()
+            return self._pool
+
+    def render_all(self, taches):
+        """{clé: (render, args)} -> {clé: données}, rendues en parallèle."""
+        if not taches:
+            return {}
+        pool = self._executor()
+        try:
+            futures = {
+                cle: pool.submit(render, *args)
+                for cle, (render, args) in taches.items()
+            }
+            return {cle: future.result() for cle, future in futures.items()}
+        except BrokenProcessPool:
+            # Processus de rendu tué : rendu sur place, pool recréé au prochain appel
+            logging.getLogger(__name__).exception("Pool de rendu des graphiques")
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            return {cle: render(*args) for cle, (render, args) in taches.items()}
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,236 @@
+import base64
+import functools
+import io
+import threading
+from collections import namedtuple
+
+import matplotlib as mpl
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.transforms import Bbox
+
+# Rendu des graphiques avec l'API objet de matplotlib (Figure + FigureCanvasAgg) :
+# aucune figure n'est enregistrée dans pyplot, donc rien ne fuit d'une requête
+# à l'autre. Chaque thread garde une figure pré-stylée par type de graphique,
+# qui est vidée puis réutilisée à chaque rendu.
+#
+# Les données de chaque graphique (points, couleurs, étiquettes, légende) sont
+# préparées par les fonctions serie_* et partagées avec le rendu SVG de
+# charts_svg.py.
+
+FOND = "#1a1a1a"
+FIGSIZE = (6, 3.5)
+_MARGES = ("left", "bottom", "right", "top", "wspace", "hspace")
+
+NIVEAU_COULEURS = {1: "red", 2: "orange", 3: "green"}
+
+# (seuil minimum, couleur, catégorie), du plus grave au moins grave
+IMC_CATEGORIES = [
+    (40, "#8B0000", "Obésité massive"),
+    (35, "#FF4500", "Obésité sévère"),
+    (30, "#FFA500", "Obésité modérée"),
+    (25, "#FFD700", "Surpoids"),
+    (float("-inf"), "#32CD32", "Normal"),
+]
+
+
+def _poignee(label, couleur):
+    return Line2D(
+        [0],
+        [0],
+        marker="o",
+        color="w",
+        label=label,
+        markerfacecolor=couleur,
+        markersize=9,
+    )
+
+
+# Entrées de légende : (libellé, couleur)
+LEGENDE_NIVEAUX = tuple(
+    (f"Niveau {niveau}", couleur) for niveau, couleur in NIVEAU_COULEURS.items()
+)
+LEGENDE_IMC = tuple(
+    (categorie, couleur) for _, couleur, categorie in reversed(IMC_CATEGORIES)
+)
+LEGENDE_TOUR = {
+    seuil: (("Normal", "green"), (f"Dépassé ({seuil} cm)", "red")) for seuil in (80, 94)
+}
+
+# Un graphique prêt à dessiner, quel que soit le format de sortie
+Serie = namedtuple(
+    "Serie", ["titre", "ylabel", "x", "y", "couleurs", "textes", "legende"]
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _poignees(legende):
+    # Poignées construites une seule fois par légende (la légende en fait des copies)
+    return [_poignee(label, couleur) for label, couleur in legende]
+
+
+class _FigurePool(threading.local):
+    def __init__(self):
+        self.figures = {}
+
+
+_pool = _FigurePool()
+
+
+def _nouvelle_figure(ylabel):
+    fig = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+    fig.patch.set_facecolor(FOND)
+    ax.set_facecolor(FOND)
+    ax.set_xlabel("Année", color="white")
+    ax.set_ylabel(ylabel, color="white")
+    ax.tick_params(colors="white")
+    ax.grid(True, linestyle="--", alpha=0.3)
+    return fig, ax
+
+
+def _figure(ylabel):
+    # Figure pré-stylée du thread courant, vidée de son contenu précédent
+    if ylabel not in _pool.figures:
+        _pool.figures[ylabel] = _nouvelle_figure(ylabel)
+        return _pool.figures[ylabel]
+
+    fig, ax = _pool.figures[ylabel]
+    for artist in [*ax.collections, *ax.texts]:
+        artist.remove()
+    if ax.get_legend() is not None:
+        ax.get_legend().remove()
+    ax.dataLim.set_points(Bbox.null().get_points())
+    ax.viewLim.set_points(Bbox.unit().get_points())
+    ax.ignore_existing_data_limits = True
+    ax.autoscale(True)
+    # tight_layout dépend de la position de départ : on repart des marges par défaut
+    fig.subplots_adjust(**{k: mpl.rcParams[f"figure.subplot.{k}"] for k in _MARGES})
+    return fig, ax
+
+
+def fig_to_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+
+# Fonction pour convertir matplotlib en base64
+def fig_to_base64(fig):
+    return base64.b64encode(fig_to_png(fig)).decode("utf-8")
+
+
+def _scatter(fig, ax, x, y, colors, labels, titre, legende):
+    ax.scatter(x, y, c=colors, s=100, edgecolors="white", linewidths=1.5)
+    for xi, yi, texte in zip(x, y, labels):
+        ax.annotate(
+            texte,
+            (xi, yi),
+            textcoords="offset points",
+            xytext=(0, 6),
+            ha="center",
+            fontsize=9,
+            color="white",
+        )
+    ax.set_title(titre, color="white")
+    ax.legend(
+        handles=legende,
+        loc="best",
+        facecolor="#2a2a2a",
+        edgecolor="#444",
+        labelcolor="white",
+    )
+    fig.tight_layout()
+    return fig_to_png(fig)
+
+
+def render_png(serie):
+    """PNG matplotlib d'une Serie (None si l'agent n'a pas de données)."""
+    if serie is None:
+        return None
+    fig, ax = _figure(serie.ylabel)
+    return _scatter(
+        fig,
+        ax,
+        serie.x,
+        serie.y,
+        serie.couleurs,
+        serie.textes,
+        serie.titre,
+        _poignees(serie.legende),
+    )
+
+
+def serie_test(agent_data, test, label, niveau_col):
+    y = agent_data[test]
+    colors = agent_data[niveau_col].map(NIVEAU_COULEURS).fillna("gray")
+    return Serie(
+        f"{label}",
+        "Résultat",
+        agent_data["année"].to_numpy(),
+        y.to_numpy(),
+        colors.to_numpy(),
+        [f"{val}" for val in y],
+        LEGENDE_NIVEAUX,
+    )
+
+
+def imc_couleur(imc):
+    for seuil, couleur, _ in IMC_CATEGORIES:
+        if imc >= seuil:
+            return couleur
+    return IMC_CATEGORIES[-1][1]
+
+
+def serie_imc(agent_data):
+    imc_data = agent_data[["année", "imc"]].dropna().sort_values("année")
+    if imc_data.empty:
+        return None
+
+    values = imc_data["imc"]
+    return Serie(
+        "Évolution de l'IMC",
+        "IMC",
+        imc_data["année"].to_numpy(),
+        values.to_numpy(),
+        [imc_couleur(val) for val in values],
+        [f"{val:.1f}" for val in values],
+        LEGENDE_IMC,
+    )
+
+
+def serie_tour(agent_data):
+    tour_data = (
+        agent_data[["année", "périmétre abdominal"]].dropna().sort_values("année")
+    )
+    if tour_data.empty:
+        return None
+
+    sexe_data = agent_data["sexe"].dropna()
+    sexe = sexe_data.iloc[-1].strip().lower() if not sexe_data.empty else "inconnu"
+    seuil = 94 if sexe == "homme" else 80
+
+    values = tour_data["périmétre abdominal"]
+    return Serie(
+        "Tour de Taille",
+        "cm",
+        tour_data["année"].to_numpy(),
+        values.to_numpy(),
+        ["red" if val > seuil else "green" for val in values],
+        [f"{val:.1f}" for val in values],
+        LEGENDE_TOUR[seuil],
+    )
+
+
+def render_test_chart(agent_data, test, label, niveau_col):
+    return render_png(serie_test(agent_data, test, label, niveau_col))
+
+
+def render_imc_chart(agent_data):
+    return render_png(serie_imc(agent_data))
+
+
+def render_tour_chart(agent_data):
+    return render_png(serie_tour(agent_data))
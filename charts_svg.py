@@ -0,0 +1,179 @@
+import math
+from xml.sax.saxutils import escape
+
+from charts import FOND, FIGSIZE, serie_imc, serie_test, serie_tour
+
+# Rendu SVG direct des graphiques (mêmes Serie que le rendu matplotlib de
+# charts.py) : fond sombre, grille pointillée, points colorés annotés et
+# légende, sans passer par matplotlib : de l'ordre d'une milliseconde par
+# graphique, contre 150 à 200 ms pour un PNG.
+
+LARGEUR, HAUTEUR = (int(v * 100) for v in FIGSIZE)
+# Zone de tracé : gauche, haut, droite, bas
+ZONE = (62, 30, LARGEUR - 12, HAUTEUR - 42)
+POLICE = "DejaVu Sans, Verdana, sans-serif"
+RAYON = 7
+MARGE = 0.05  # marge relative autour des données, comme matplotlib
+
+
+def _pas(etendue, cible=6):
+    # Pas « rond » (1, 2, 2.5, 5 × 10^n) donnant environ `cible` graduations
+    brut = etendue / cible
+    puissance = 10 ** math.floor(math.log10(brut))
+    for facteur in (1, 2, 2.5, 5, 10):
+        if facteur * puissance >= brut:
+            return facteur * puissance
+    return 10 * puissance
+
+
+def _bornes(valeurs, entier=False):
+    bas, haut = min(valeurs), max(valeurs)
+    if bas == haut:
+        ecart = 1 if entier or bas == 0 else abs(bas) * 0.05
+        bas, haut = bas - ecart, haut + ecart
+    marge = (haut - bas) * MARGE
+    return bas - marge, haut + marge
+
+
+def _graduations(bas, haut, entier=False):
+    pas = _pas(haut - bas)
+    if entier:
+        pas = max(1, round(pas))
+    debut = math.ceil(bas / pas) * pas
+    valeurs = []
+    v = debut
+    while v <= haut + pas * 1e-9:
+        valeurs.append(round(v, 10))
+        v += pas
+    decimales = len(f"{pas:f}".rstrip("0").split(".")[1])
+    return [(v, f"{v:.{decimales}f}") for v in valeurs]
+
+
+def _texte(x, y, contenu, taille, ancre="middle", extra=""):
+    return (
+        f'<text x="{x:.1f}" y="{y:.1f}" font-size="{taille}" fill="white" '
+        f'text-anchor="{ancre}"{extra}>{escape(str(contenu))}</text>'
+    )
+
+
+def _legende(legende, points):
+    # Emplacement « best » simplifié : le coin qui recouvre le moins de points
+    largeur = 34 + 6.2 * max(len(label) for label, _ in legende)
+    hauteur = 8 + 17 * len(legende)
+    gauche, haut, droite, bas = ZONE
+    coins = [
+        (droite - largeur - 6, haut + 6),
+        (gauche + 6, haut + 6),
+        (gauche + 6, bas - hauteur - 6),
+        (droite - largeur - 6, bas - hauteur - 6),
+    ]
+
+    def recouvrement(coin):
+        x0, y0 = coin
+        return sum(
+            x0 - RAYON <= px <= x0 + largeur + RAYON
+            and y0 - RAYON - 14 <= py <= y0 + hauteur + RAYON
+            for px, py in points
+        )
+
+    x0, y0 = min(coins, key=recouvrement)
+    elements = [
+        f'<rect x="{x0:.1f}" y="{y0:.1f}" width="{largeur:.1f}" height="{hauteur}" '
+        f'rx="3" fill="#2a2a2a" fill-opacity="0.8" stroke="#444"/>'
+    ]
+    for i, (label, couleur) in enumerate(legende):
+        cy = y0 + 12.5 + 17 * i
+        elements.append(
+            f'<circle cx="{x0 + 14:.1f}" cy="{cy:.1f}" r="4.5" '
+            f'fill="{escape(couleur)}" stroke="white" stroke-width="1"/>'
+        )
+        elements.append(_texte(x0 + 26, cy + 3.5, label, 10, ancre="start"))
+    return elements
+
+
+def render_svg(serie):
+    """SVG autonome d'une Serie (None si l'agent n'a pas de données)."""
+    if serie is None:
+        return None
+    points = [
+        (float(x), float(y), couleur, texte)
+        for x, y, couleur, texte in zip(serie.x, serie.y, serie.couleurs, serie.textes)
+        if not (math.isnan(float(x)) or math.isnan(float(y)))
+    ]
+    gauche, haut, droite, bas = ZONE
+    positions = []
+    elements = [
+        f'<rect width="{LARGEUR}" height="{HAUTEUR}" fill="{FOND}"/>',
+        f'<rect x="{gauche}" y="{haut}" width="{droite - gauche}" '
+        f'height="{bas - haut}" fill="{FOND}" stroke="white" stroke-width="0.8"/>',
+        _texte((gauche + droite) / 2, haut - 9, serie.titre, 12),
+        _texte((gauche + droite) / 2, HAUTEUR - 6, "Année", 10),
+        _texte(
+            14,
+            (haut + bas) / 2,
+            serie.ylabel,
+            10,
+            extra=f' transform="rotate(-90 14 {(haut + bas) / 2:.1f})"',
+        ),
+    ]
+
+    if points:
+        x_min, x_max = _bornes([p[0] for p in points], entier=True)
+        y_min, y_max = _bornes([p[1] for p in points])
+
+        def px(x):
+            return gauche + (x - x_min) / (x_max - x_min) * (droite - gauche)
+
+        def py(y):
+            return bas - (y - y_min) / (y_max - y_min) * (bas - haut)
+
+        grille = 'stroke="#b0b0b0" stroke-opacity="0.3" stroke-dasharray="3.7 1.6"'
+        for valeur, libelle in _graduations(x_min, x_max, entier=True):
+            x = px(valeur)
+            elements.append(
+                f'<line x1="{x:.1f}" y1="{haut}" x2="{x:.1f}" y2="{bas}" {grille}/>'
+            )
+            elements.append(
+                f'<line x1="{x:.1f}" y1="{bas}" x2="{x:.1f}" y2="{bas + 4}" '
+                'stroke="white"/>'
+            )
+            elements.append(_texte(x, bas + 16, libelle, 10))
+        for valeur, libelle in _graduations(y_min, y_max):
+            y = py(valeur)
+            elements.append(
+                f'<line x1="{gauche}" y1="{y:.1f}" x2="{droite}" y2="{y:.1f}" '
+                f"{grille}/>"
+            )
+            elements.append(
+                f'<line x1="{gauche - 4}" y1="{y:.1f}" x2="{gauche}" y2="{y:.1f}" '
+                'stroke="white"/>'
+            )
+            elements.append(_texte(gauche - 7, y + 3.5, libelle, 10, ancre="end"))
+
+        for x, y, couleur, texte in points:
+            cx, cy = px(x), py(y)
+            positions.append((cx, cy))
+            elements.append(
+                f'<circle cx="{cx:.1f}" cy="{cy:.1f}" r="{RAYON}" '
+                f'fill="{escape(couleur)}" stroke="white" stroke-width="2"/>'
+            )
+            elements.append(_texte(cx, cy - RAYON - 4, texte, 9))
+    elements.extend(_legende(serie.legende, positions))
+
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" '
+        f'width="{LARGEUR}" height="{HAUTEUR}" viewBox="0 0 {LARGEUR} {HAUTEUR}" '
+        f'font-family="{POLICE}">' + "".join(elements) + "</svg>"
+    ).encode("utf-8")
+
+
+def render_test_chart(agent_data, test, label, niveau_col):
+    return render_svg(serie_test(agent_data, test, label, niveau_col))
+
+
+def render_imc_chart(agent_data):
+    return render_svg(serie_imc(agent_data))
+
+
+def render_tour_chart(agent_data):
+    return render_svg(serie_tour(agent_data))
@@ -0,0 +1,188 @@
+import numpy as np
+
+from dataset import load_or_build, write_snapshot
+
+# Comparaison de chaque agent à ses pairs : même sexe, tranche d'âge,
+# catégorie et année. Les valeurs de chaque cohorte sont triées une fois au
+# chargement ; le percentile d'un agent est ensuite une recherche binaire.
+
+# Bornes basses des tranches d'âge et libellés correspondants
+TRANCHES_AGE = [0, 25, 35, 45, 55]
+LIBELLES_AGE = [
+    "moins de 25 ans",
+    "25-34 ans",
+    "35-44 ans",
+    "45-54 ans",
+    "55 ans et +",
+]
+
+# En dessous de cet effectif, pas de percentile (comparaison peu significative)
+EFFECTIF_MIN = 5
+
+# Format des cohortes sauvegardées (voir dataset.load_or_build)
+COHORTS_FORMAT = 2
+
+
+def tranche_age(age):
+    # Indice dans LIBELLES_AGE, -1 si l'âge est inconnu
+    age = np.asarray(age, dtype=float)
+    return np.where(
+        np.isnan(age), -1, np.searchsorted(TRANCHES_AGE, age, side="right") - 1
+    )
+
+
+def build_cohorts(tables, tests):
+    """{test: {(sexe, tranche d'âge, catégorie, année): valeurs triées}}.
+
+    Un agent compte une fois par année et par catégorie (les doubles statuts
+    figurent dans les deux cohortes), avec sa première mesure de l'année.
+    """
+    cles = ["sexe", "tranche", "catégorie", "année"]
+    mesures = tables.mesures
+    tests = [t for t in tests if t in mesures.columns]
+    categories = tables.affectations[["matricule", "année", "catégorie"]]
+    data = mesures[["matricule", "année", *tests]].merge(
+        categories.drop_duplicates(), on=["matricule", "année"]
+    )
+    agents = tables.agents.reindex(data["matricule"])
+    data["sexe"] = agents["sexe"].to_numpy()
+    data["tranche"] = tranche_age(agents["age"])
+    data = data[data["tranche"] >= 0]
+
+    cohortes = {}
+    for test in tests:
+        valeurs = data.assign(valeur=data[test].astype(float)).dropna(
+            subset=["sexe", "catégorie", "valeur"]
+        )
+        valeurs = valeurs.drop_duplicates(["matricule", "catégorie", "année"])
+        valeurs = valeurs.sort_values([*cles, "valeur"], kind="stable")
+        groupes = valeurs.groupby(cles, sort=False, observed=True).indices
+        tableau = valeurs["valeur"].to_numpy()
+        cohortes[test] = {
+            (sexe, int(tranche), categorie, int(annee)): tableau[positions]
+            for (sexe, tranche, categorie, annee), positions in groupes.items()
+        }
+    return cohortes
+
+
+def load_cohorts(tables, tests, key, cache_path=None):
+    """Cohortes lues dans cache_path si l'empreinte correspond, sinon recalculées."""
+    return load_or_build(
+        cache_path,
+        f"{key}-v{COHORTS_FORMAT}",
+        lambda: build_cohorts(tables, tests),
+    )
+
+
+def save_cohorts(cache_path, key, cohortes):
+    write_snapshot(cache_path, f"{key}-v{COHORTS_FORMAT}", cohortes)
+
+
+def _retirer(valeurs, retirees):
+    # Retire de `valeurs` (triées) une occurrence de chaque valeur de `retirees`
+    garder = np.ones(len(valeurs), dtype=bool)
+    uniques, nombres = np.unique(retirees, return_counts=True)
+    for debut, nombre in zip(np.searchsorted(valeurs, uniques), nombres):
+        garder[debut : debut + nombre] = False
+    return valeurs[garder]
+
+
+def update_cohorts(cohortes, avant, apres, tests):
+    """Cohortes après remplacement des données de quelques agents.
+
+    `avant` et `apres` : tables réduites à ces agents (subset_tables). Seules
+    les cohortes où ils figurent changent : leurs anciennes valeurs en sont
+    retirées et les nouvelles insérées à leur place.
+    """
+    retirees = build_cohorts(avant, tests)
+    ajoutees = build_cohorts(apres, tests)
+    resultat = {}
+    for test in dict.fromkeys([*cohortes, *ajoutees]):
+        groupes = dict(cohortes.get(test, {}))
+        moins = retirees.get(test, {})
+        plus = ajoutees.get(test, {})
+        for cle in set(moins) | set(plus):
+            valeurs = groupes.get(cle, np.empty(0))
+            if cle in moins:
+                valeurs = _retirer(valeurs, moins[cle])
+            if cle in plus:
+                valeurs = np.sort(np.concatenate([valeurs, plus[cle]]))
+            if len(valeurs):
+                groupes[cle] = valeurs
+            else:
+                groupes.pop(cle, None)
+        resultat[test] = groupes
+    return resultat
+
+
+def percentile(valeurs, valeur):
+    """Rang centile de `valeur` dans `valeurs` triées (ex aequo pour moitié)."""
+    bas = np.searchsorted(valeurs, valeur, side="left")
+    haut = np.searchsorted(valeurs, valeur, side="right")
+    return 100 * (bas + (haut - bas) / 2) / len(valeurs)
+
+
+def derniers_resultats(data, tests):
+    """Dernier résultat (matricule, test, année, valeur) de chaque agent par test."""
+    tests = [t for t in tests if t in data.columns]
+    long = data[["matricule", "année", *tests]].melt(
+        id_vars=["matricule", "année"],
+        value_vars=tests,
+        var_name="test",
+        value_name="valeur",
+    )
+    long = long.dropna(subset=["valeur"])
+    long = long.sort_values(["matricule", "test", "année"], kind="stable")
+    return long.groupby(["matricule", "test"], sort=False, observed=True).tail(1)
+
+
+def _libelle(valeur, defaut):
+    return valeur if isinstance(valeur, str) else defaut
+
+
+def agent_percentiles(cohortes, data, profils, test_labels):
+    """Position de chaque agent dans sa cohorte, test par test.
+
+    `data` : mesures des agents, `profils` : leur fiche (agent_profiles), dont
+    le genre, l'âge et la catégorie définissent la cohorte. Renvoie
+    {matricule: [{test, annee, valeur, percentile, effectif, cohorte}, ...]}
+    dans l'ordre de `test_labels`.
+    """
+    ordre = {test: i for i, test in enumerate(test_labels)}
+    resultats = derniers_resultats(data, list(test_labels))
+    resultats = resultats.assign(_ordre=resultats["test"].map(ordre)).sort_values(
+        "_ordre", kind="stable"
+    )
+    tranches = dict(zip(profils.index, tranche_age(profils["age"]).tolist()))
+    profils = profils[["genre", "categorie"]].to_dict("index")
+
+    par_agent = {matricule: [] for matricule in profils}
+    for row in resultats.itertuples(index=False):
+        if row.matricule not in par_agent:
+            continue
+        profil = profils[row.matricule]
+        tranche = tranches[row.matricule]
+        cle = (profil["genre"], tranche, profil["categorie"], int(row.année))
+        valeurs = cohortes.get(row.test, {}).get(cle)
+        effectif = 0 if valeurs is None else len(valeurs)
+        rang = None
+        if effectif >= EFFECTIF_MIN:
+            rang = round(float(percentile(valeurs, row.valeur)), 1)
+        par_agent[row.matricule].append(
+            {
+                "test": test_labels[row.test],
+                "annee": int(row.année),
+                "valeur": float(row.valeur),
+                "percentile": rang,
+                "effectif": effectif,
+                "cohorte": ", ".join(
+                    [
+                        _libelle(profil["genre"], "sexe inconnu"),
+                        LIBELLES_AGE[tranche] if tranche >= 0 else "âge inconnu",
+                        _libelle(profil["categorie"], "catégorie inconnue"),
+                        str(int(row.année)),
+                    ]
+                ),
+            }
+        )
+    return par_agent
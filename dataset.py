@@ -0,0 +1,503 @@
+import hashlib
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# Format de l'instantané binaire : à incrémenter quand le nettoyage change
+SNAPSHOT_FORMAT = 5
+
+# Colonnes inutilisées par l'application
+COLONNES_INUTILES = ["unnamed: 0", "_merge"]
+
+# Colonnes texte à faible cardinalité, stockées en catégories
+COLONNES_CATEGORIES = [
+    "groupement",
+    "compagnie",
+    "cis",
+    "grade",
+    "catégorie",
+    "sexe",
+    "personnel",
+    "observations",
+    "double statut",
+    # Dates saisies en texte, peu de valeurs distinctes
+    "icp saisis en date du",
+    "date de la visite effectuée",
+    "entrée sis 67 en tant que spp",
+    # Répété sur chaque ligne de l'agent, dans chaque table ; repassé en texte
+    # dans les lignes extraites pour quelques agents (rows_for_matricules)
+    "matricule",
+]
+
+# Colonnes propres à l'agent (identiques sur toutes ses lignes) et colonnes
+# d'affectation ; toutes les autres sont des mesures (tests, visite médicale)
+COLONNES_AGENT = ["sexe", "age", "double statut"]
+COLONNES_AFFECTATION = [
+    "groupement",
+    "compagnie",
+    "cis",
+    "grade",
+    "catégorie",
+    "personnel",
+    "entrée sis 67 en tant que spp",
+]
+
+# Données normalisées : agents (indexé par matricule), affectations et mesures
+# (avec matricule et année, dans l'ordre du CSV)
+Tables = namedtuple("Tables", ["agents", "affectations", "mesures"])
+
+
+def load_dataset(path):
+    df = pd.read_csv(path, dtype={"matricule": str})
+    df["sexe"] = (
+        df["sexe"]
+        .astype(str)
+        .str.strip()
+        .str.lower()
+        .replace({"m": "homme", "f": "femme", "h": "homme"})
+    )
+
+    df.columns = df.columns.str.strip().str.lower()
+    df["matricule"] = (
+        df["matricule"].astype(str).str.strip().str.replace(".0", "", regex=False)
+    )
+    return compact_dtypes(df)
+
+
+def _sans_perte(origine, converti):
+    return np.array_equal(
+        origine.to_numpy(dtype=float),
+        converti.to_numpy(dtype=float, na_value=np.nan),
+        equal_nan=True,
+    )
+
+
+def _compacter(col, serie):
+    if col in COLONNES_CATEGORIES:
+        return serie.astype("category")
+    if col == "année":
+        return serie.astype("int16")
+    if serie.dtype == "float64":
+        if col.startswith("niv"):
+            # Niveaux 0 à 3, avec des valeurs manquantes
+            converti = serie.round().astype("Int8")
+        else:
+            # Les décimales (Luc Léger, poids, IMC) ne sont pas représentables
+            # exactement en float32 : ces colonnes restent en float64
+            converti = serie.astype("float32")
+        if _sans_perte(serie, converti):
+            return converti
+    return serie
+
+
+def compact_dtypes(df):
+    """Catégories pour les textes répétitifs, entiers courts et float32 sans perte."""
+    df = df.drop(columns=[c for c in COLONNES_INUTILES if c in df.columns])
+    for col in df.columns:
+        df[col] = _compacter(col, df[col])
+    return df
+
+
+def append_rows(df, delta):
+    """Lignes de `delta` (nettoyé par load_dataset) ajoutées à la fin de `df`.
+
+    Les colonnes dont le type change (nouvelles catégories, valeurs qui ne
+    tiennent plus en float32...) sont recompactées comme par load_dataset :
+    le résultat est celui qu'aurait donné la relecture du CSV complet.
+    """
+    inconnues = [c for c in delta.columns if c not in df.columns]
+    if inconnues:
+        raise ValueError(f"Colonnes inconnues : {', '.join(inconnues)}")
+    resultat = pd.concat([df, delta.reindex(columns=df.columns)], ignore_index=True)
+    for col in resultat.columns:
+        if resultat[col].dtype != df[col].dtype:
+            serie = resultat[col]
+            if serie.dtype == object:
+                serie = serie.astype(float if df[col].dtype.kind == "f" else "str")
+            resultat[col] = _compacter(col, serie)
+    return resultat
+
+
+def split_tables(df):
+    """Sépare les lignes nettoyées du CSV en agents, affectations et mesures.
+
+    Le CSV répète les résultats d'une année sur chaque ligne d'affectation de
+    l'agent (double statut, mutation). `agents` garde la dernière valeur
+    renseignée de chaque attribut ; `affectations` et `mesures` gardent une
+    ligne par valeur distincte de l'année : plusieurs mesures seulement quand
+    l'agent a passé les tests plusieurs fois dans l'année.
+    """
+    colonnes_agent = [c for c in COLONNES_AGENT if c in df.columns]
+    colonnes_affectation = [c for c in COLONNES_AFFECTATION if c in df.columns]
+    cles = ["matricule", "année"]
+    colonnes_mesure = [
+        c
+        for c in df.columns
+        if c not in (*cles, *colonnes_agent, *colonnes_affectation)
+    ]
+    agents = df[["matricule", *colonnes_agent]].groupby("matricule", sort=False)
+    return Tables(
+        agents=agents.last(),
+        affectations=df[[*cles, *colonnes_affectation]].drop_duplicates(
+            ignore_index=True
+        ),
+        mesures=df[[*cles, *colonnes_mesure]].drop_duplicates(ignore_index=True),
+    )
+
+
+def load_tables(path):
+    return split_tables(load_dataset(path))
+
+
+def memory_report(df):
+    # Mémoire occupée par colonne, en Mo
+    return (df.memory_usage(deep=True) / 1024 / 1024).round(3)
+
+
+def tables_memory(tables):
+    # Mémoire occupée par table, en Mo ; les catégories partagées entre les
+    # tables (matricules) ne sont comptées qu'une fois
+    vues = set()
+    memoire = {}
+    for nom, table in tables._asdict().items():
+        octets = table.memory_usage(deep=True).sum()
+        for dtype in [table.index.dtype, *table.dtypes]:
+            if isinstance(dtype, pd.CategoricalDtype):
+                if id(dtype.categories) in vues:
+                    octets -= dtype.categories.memory_usage(deep=True)
+                vues.add(id(dtype.categories))
+        memoire[nom] = octets / 1024 / 1024
+    return pd.Series(memoire).round(3)
+
+
+def source_key(path):
+    # Empreinte du fichier source, utilisée comme version des données
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloc)
+    return sha.hexdigest()
+
+
+def snapshot_path(path):
+    return os.path.splitext(path)[0] + ".snapshot.pkl"
+
+
+def read_snapshot(path, key):
+    # Contenu d'un instantané binaire, ou None s'il manque ou n'est plus à jour
+    try:
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+        if saved["key"] == key:
+            return saved["data"]
+    except (
+        OSError,
+        pickle.UnpicklingError,
+        EOFError,
+        KeyError,
+        TypeError,
+        AttributeError,
+    ):
+        pass
+    return None
+
+
+def write_snapshot(path, key, data):
+    # Écriture atomique : un worker ne lit jamais un fichier à moitié écrit
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            pickle.dump({"key": key, "data": data}, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_or_build(cache_path, key, build):
+    """Table sauvegardée dans cache_path si sa clé correspond, sinon build().
+
+    La clé combine l'empreinte du CSV et le format de la table, à incrémenter
+    quand son contenu change : une table d'une autre version des données ou
+    d'un ancien format est recalculée, puis sauvegardée. Sans cache_path, la
+    table est toujours recalculée.
+    """
+    data = read_snapshot(cache_path, key) if cache_path else None
+    if data is None:
+        data = build()
+        if cache_path:
+            write_snapshot(cache_path, key, data)
+    return data
+
+
+def load_dataset_cached(path, key=None):
+    """Tables de l'instantané s'il est à jour, sinon relues depuis le CSV."""
+    return load_or_build(
+        snapshot_path(path),
+        f"{key or source_key(path)}-v{SNAPSHOT_FORMAT}",
+        lambda: load_tables(path),
+    )
+
+
+def save_dataset_snapshot(path, key, tables):
+    # Instantané déjà calculé (ingestion), pour la version `key` du fichier
+    write_snapshot(snapshot_path(path), f"{key}-v{SNAPSHOT_FORMAT}", tables)
+
+
+def file_signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+class DatasetStore:
+    """Version courante des données, reconstruite hors du chemin des requêtes.
+
+    `build(path)` produit un objet immuable (données nettoyées, index, tables
+    dérivées). `get()` vérifie au plus toutes les `check_interval` secondes si
+    le fichier source a changé ; si oui, la reconstruction part dans un thread
+    et la nouvelle version remplace l'ancienne d'une seule affectation. Les
+    requêtes en cours gardent la version qu'elles ont obtenue.
+    """
+
+    def __init__(self, path, build, check_interval=5.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._build = build
+        self._lock = threading.Lock()
+        self._reloading = False
+        self._last_check = time.monotonic()
+        self._signature = file_signature(path)
+        self.current = build(path)
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._last_check >= self.check_interval:
+            self._last_check = now
+            self.check()
+        return self.current
+
+    def check(self):
+        # Lance une reconstruction si le fichier a changé ; renvoie le thread
+        try:
+            signature = file_signature(self.path)
+        except OSError:
+            return None
+        if signature == self._signature:
+            return None
+        with self._lock:
+            if self._reloading:
+                return None
+            self._reloading = True
+        thread = threading.Thread(target=self._reload, args=(signature,), daemon=True)
+        thread.start()
+        return thread
+
+    def _reload(self, signature):
+        try:
+            nouveau = self._build(self.path)
+        except Exception:
+            # Fichier en cours de copie ou invalide : nouvel essai au prochain check
+            logging.getLogger(__name__).exception("Rechargement de %s", self.path)
+        else:
+            self.current = nouveau
+            self._signature = signature
+        finally:
+            with self._lock:
+                self._reloading = False
+
+
+def build_matricule_index(df):
+    # Positions des lignes de chaque matricule, dans l'ordre d'origine
+    return df.groupby("matricule", sort=False).indices
+
+
+def extend_matricule_index(index, delta, debut):
+    """Index après ajout des lignes de `delta` à partir de la position `debut`."""
+    index = dict(index)
+    for matricule, positions in build_matricule_index(delta).items():
+        positions = positions + debut
+        if matricule in index:
+            positions = np.concatenate([index[matricule], positions])
+        index[matricule] = positions
+    return index
+
+
+def append_table(table, index, lignes):
+    """Table et index après ajout de `lignes`, sans celles déjà présentes.
+
+    Même résultat que drop_duplicates sur la table complète : seules les
+    lignes des agents concernés sont comparées.
+    """
+    resultat = append_rows(table, lignes)
+    nouvelles = resultat.iloc[len(table) :]
+    existantes = rows_for_matricules(resultat, index, nouvelles["matricule"].unique())
+    vues = pd.util.hash_pandas_object(existantes, index=False)
+    empreintes = pd.util.hash_pandas_object(nouvelles, index=False)
+    garder = ~(empreintes.isin(vues) | empreintes.duplicated()).to_numpy()
+    if not garder.all():
+        resultat = resultat[np.concatenate([np.ones(len(table), dtype=bool), garder])]
+        resultat = resultat.reset_index(drop=True)
+    return resultat, extend_matricule_index(
+        index, resultat.iloc[len(table) :], len(table)
+    )
+
+
+def update_agents(agents, ajout):
+    """Agents après ajout de `ajout` (agents d'un delta), dernière valeur connue.
+
+    Les agents déjà connus restent à leur place, les nouveaux vont à la fin.
+    """
+    connus = [m for m in ajout.index if m in agents.index]
+    maj = append_rows(agents.loc[connus].reset_index(), ajout.reset_index())
+    maj = maj.groupby("matricule", sort=False).last()
+
+    n = len(agents)
+    resultat = append_rows(agents.reset_index(), maj.reset_index())
+    positions = agents.index.get_indexer(maj.index)
+    ordre = np.arange(n)
+    ordre[positions[positions >= 0]] = n + np.flatnonzero(positions >= 0)
+    ordre = np.concatenate([ordre, n + np.flatnonzero(positions < 0)])
+    return resultat.take(ordre).set_index("matricule")
+
+
+def append_tables(tables, index, affectations_index, delta):
+    """Tables et index après ajout des tables `delta` (split_tables d'un delta)."""
+    mesures, index = append_table(tables.mesures, index, delta.mesures)
+    affectations, affectations_index = append_table(
+        tables.affectations, affectations_index, delta.affectations
+    )
+    agents = update_agents(tables.agents, delta.agents)
+    if isinstance(agents.index.dtype, pd.CategoricalDtype):
+        # Catégories des matricules partagées par les trois tables, comme au
+        # chargement du CSV (recompactées séparément par append_rows)
+        categories = agents.index.categories
+        mesures["matricule"] = mesures["matricule"].cat.set_categories(categories)
+        affectations["matricule"] = affectations["matricule"].cat.set_categories(
+            categories
+        )
+    return Tables(agents, affectations, mesures), index, affectations_index
+
+
+def rows_version(rows):
+    # Empreinte du contenu des lignes d'un agent (indépendante de la version
+    # du fichier) : elle ne change que si ses lignes changent
+    empreintes = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    return hashlib.sha1(empreintes.tobytes()).hexdigest()
+
+
+def _matricules_texte(rows):
+    # Matricules d'un extrait en texte : la catégorie porterait tous ceux du
+    # dataset dans chaque extrait (mémoire, pickle vers les workers)
+    return rows.assign(matricule=rows["matricule"].astype(str))
+
+
+def agent_rows(tables, index, matricule):
+    """Mesures d'un agent (index des mesures) avec son sexe, pour les graphiques."""
+    positions = index.get(matricule)
+    if positions is None:
+        return _matricules_texte(tables.mesures.iloc[0:0])
+    rows = _matricules_texte(tables.mesures.take(positions))
+    if "sexe" in tables.agents.columns:
+        rows = rows.assign(sexe=tables.agents.at[matricule, "sexe"])
+    return rows
+
+
+def rows_for_matricules(df, index, matricules):
+    # Lignes de plusieurs agents (trouvés dans l'index), regroupées par agent
+    positions = [index[m] for m in dict.fromkeys(matricules) if m in index]
+    if not positions:
+        return _matricules_texte(df.iloc[0:0])
+    return _matricules_texte(df.take(np.concatenate(positions)))
+
+
+def subset_tables(tables, index, affectations_index, matricules):
+    # Tables réduites aux agents `matricules` trouvés
+    trouves = [m for m in dict.fromkeys(matricules) if m in index]
+    agents = tables.agents.loc[trouves]
+    return Tables(
+        agents=agents.set_axis(agents.index.astype(str)),
+        affectations=rows_for_matricules(
+            tables.affectations, affectations_index, trouves
+        ),
+        mesures=rows_for_matricules(tables.mesures, index, trouves),
+    )
+
+
+def agent_profiles(tables, index, affectations_index, matricules):
+    """Fiche de base de plusieurs agents en une passe (une ligne par matricule trouvé).
+
+    Mêmes règles que la fiche agent : grade de la première affectation, unité
+    et catégorie de la dernière, genre et âge de l'agent, taille dernière
+    renseignée, poids le plus récent entre 2011 et 2024.
+    """
+    trouves = [m for m in dict.fromkeys(matricules) if m in index]
+    colonnes = [
+        "grade",
+        "localisation",
+        "categorie",
+        "genre",
+        "taille",
+        "age",
+        "poids",
+        "poids_annee",
+    ]
+    if not trouves:
+        return pd.DataFrame(columns=colonnes, index=pd.Index([], name="matricule"))
+
+    sous = subset_tables(tables, index, affectations_index, trouves)
+    affectations = sous.affectations.groupby("matricule", sort=False)
+    premiere = affectations.head(1).set_index("matricule")
+    derniere = affectations.tail(1).set_index("matricule")
+    data = sous.mesures
+    taille = data.groupby("matricule", sort=False)["taille"].last()
+
+    poids = data[["matricule", "année", "poids"]].dropna()
+    poids = poids[poids["année"].between(2011, 2024)]
+    poids = poids[
+        poids["année"]
+        == poids.groupby("matricule", sort=False)["année"].transform("max")
+    ]
+    poids = poids.groupby("matricule", sort=False).head(1).set_index("matricule")
+
+    profils = pd.DataFrame(
+        {
+            "grade": premiere["grade"].astype(object),
+            "localisation": derniere["cis"].astype(object),
+            "categorie": derniere["catégorie"].astype(object),
+            "genre": sous.agents["sexe"].astype(object),
+            "taille": taille.astype(float),
+            "age": sous.agents["age"].astype(float),
+            "poids": poids["poids"].astype(float),
+            "poids_annee": poids["année"].astype("Int64"),
+        },
+        index=pd.Index(trouves, name="matricule"),
+    )
+    return profils[colonnes]
+
+
+if __name__ == "__main__":
+    # Prétraitement : python dataset.py [dataset_corrige.csv]
+    # Tables créées par le module importé : l'instantané doit référencer
+    # dataset.Tables, pas __main__.Tables
+    import dataset
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "dataset_corrige.csv"
+    df = load_dataset(source)
+    tables = dataset.split_tables(df)
+    key = f"{source_key(source)}-v{SNAPSHOT_FORMAT}"
+    write_snapshot(snapshot_path(source), key, tables)
+    print(f"Instantané écrit : {snapshot_path(source)}")
+
+    brut = pd.read_csv(source, dtype={"matricule": str})
+    print(f"CSV brut : {len(brut)} lignes, {memory_report(brut).sum():.2f} Mo")
+    print(f"Lignes compactes : {len(df)} lignes, {memory_report(df).sum():.2f} Mo")
+    memoire = tables_memory(tables)
+    for nom, table in tables._asdict().items():
+        print(f"Table {nom} : {len(table)} lignes, {memoire[nom]:.2f} Mo")
+    print(f"Tables normalisées : {memoire.sum():.2f} Mo")
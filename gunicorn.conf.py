@@ -0,0 +1,18 @@
+# Configuration gunicorn, lue automatiquement depuis le répertoire courant
+import gc
+import os
+
+# app.py (et donc le dataset, ses index et la table d'alertes) est chargé une
+# seule fois dans le processus maître, avant le fork : les workers partagent
+# ces pages en lecture, la mémoire dépend alors du nombre de workers et non
+# plus de la taille des données. GUNICORN_PRELOAD=0 revient au chargement
+# par worker.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") != "0"
+
+
+def when_ready(server):
+    # Les objets chargés avant le fork sont exclus du ramasse-miettes : sans
+    # cela, chaque collecte dans un worker réécrit leurs en-têtes et duplique
+    # les pages partagées.
+    if preload_app:
+        gc.freeze()
@@ -0,0 +1,190 @@
+"""Ajout des résultats d'une nouvelle campagne au dataset, sans tout recalculer.
+
+    python ingest.py nouveaux.csv [--data dataset_corrige.csv]
+
+Le fichier delta (mêmes colonnes que le dataset, dans n'importe quel ordre)
+est nettoyé comme le dataset (sexe, matricule, types compacts) et ses lignes
+sont ajoutées à la fin du CSV. L'instantané binaire, la table d'alertes, les
+cohortes et les indicateurs par unité de la nouvelle version sont écrits
+directement : les alertes ne sont recalculées que pour les matricules du
+delta, et seules les cohortes et les unités où ces agents figurent sont
+modifiées. Les graphiques en cache sont indexés par l'empreinte des lignes de
+chaque agent : seuls ceux des agents du delta seront rendus à nouveau. Les
+serveurs en cours détectent le nouveau fichier et chargent ces tables sans
+recalcul.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import os
+import time
+from datetime import datetime, timezone
+
+import app
+from alert_engine import save_alert_table, update_alert_table
+from cohorts import save_cohorts, update_cohorts
+from dataset import (
+    append_tables,
+    load_tables,
+    save_dataset_snapshot,
+    subset_tables,
+)
+from matricule_search import build_matricule_search
+from rollups import save_rollups, update_rollups
+
+
+def _nom(colonne):
+    return colonne.strip().lower()
+
+
+def lignes_delta(path, entete):
+    """Lignes brutes du fichier delta, dans l'ordre des colonnes `entete` du CSV."""
+    cibles = [_nom(c) for c in entete]
+    with open(path, newline="", encoding="utf-8") as f:
+        lecteur = csv.reader(f)
+        colonnes = [_nom(c) for c in next(lecteur)]
+        inconnues = [c for c in colonnes if c not in cibles]
+        if inconnues:
+            raise ValueError(f"Colonnes inconnues : {', '.join(inconnues)}")
+        positions = [colonnes.index(c) if c in colonnes else None for c in cibles]
+        for ligne in lecteur:
+            if ligne:
+                yield ["" if i is None else ligne[i] for i in positions]
+
+
+def copier_avec_delta(path, delta_path):
+    """Copie temporaire du CSV suivie des lignes du delta : (chemin, empreinte).
+
+    L'empreinte est celle que source_key calculera sur le nouveau fichier.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        entete = next(csv.reader(f))
+    lignes = lignes_delta(delta_path, entete)
+
+    sha = hashlib.sha1()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(path, "rb") as source, open(tmp, "wb") as copie:
+        dernier = b"\n"
+        for bloc in iter(lambda: source.read(1 << 20), b""):
+            sha.update(bloc)
+            copie.write(bloc)
+            dernier = bloc[-1:]
+
+        buf = io.StringIO()
+        if dernier != b"\n":
+            buf.write("\n")
+        csv.writer(buf, lineterminator="\n").writerows(lignes)
+        ajout = buf.getvalue().encode("utf-8")
+        sha.update(ajout)
+        copie.write(ajout)
+    return tmp, sha.hexdigest()
+
+
+def ingerer(donnees, path, delta_path):
+    """Ajoute `delta_path` au dataset `path`, dont `donnees` est la version chargée.
+
+    Renvoie la nouvelle version (Donnees), les matricules du delta et la durée
+    de chaque étape.
+    """
+    durees = {}
+    debut = time.perf_counter()
+
+    def etape(nom):
+        nonlocal debut
+        fin = time.perf_counter()
+        durees[nom] = fin - debut
+        debut = fin
+
+    delta = load_tables(delta_path)
+    matricules = list(delta.agents.index)
+    etape("lecture du delta")
+
+    tables, index, affectations_index = append_tables(
+        donnees.tables, donnees.index, donnees.affectations_index, delta
+    )
+    etape("ajout des lignes")
+
+    alertes = update_alert_table(
+        donnees.alertes,
+        tables,
+        index,
+        affectations_index,
+        app.test_labels,
+        matricules,
+    )
+    etape("alertes")
+
+    # Données des agents du delta avant et après l'ajout
+    avant = subset_tables(
+        donnees.tables, donnees.index, donnees.affectations_index, matricules
+    )
+    apres = subset_tables(tables, index, affectations_index, matricules)
+    cohortes = update_cohorts(donnees.cohortes, avant, apres, list(app.test_labels))
+    etape("cohortes")
+
+    unites = update_rollups(
+        donnees.unites, avant, donnees.alertes, apres, alertes, app.niveau_cols
+    )
+    etape("unités")
+
+    # Tables de la nouvelle version écrites avant le CSV : un serveur qui
+    # voit le nouveau fichier les trouve à jour
+    tmp, version = copier_avec_delta(path, delta_path)
+    try:
+        save_dataset_snapshot(path, version, tables)
+        save_alert_table(app.table_path(path, "alertes"), version, alertes)
+        save_cohorts(app.table_path(path, "cohortes"), version, cohortes)
+        save_rollups(app.table_path(path, "rollups"), version, unites)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    etape("écriture")
+
+    modified = datetime.fromtimestamp(int(os.path.getmtime(path)), timezone.utc)
+    nouvelles = app.Donnees(
+        version=version,
+        modified=modified,
+        tables=tables,
+        index=index,
+        affectations_index=affectations_index,
+        alertes=alertes,
+        cohortes=cohortes,
+        unites=unites,
+        recherche=build_matricule_search(tables, index, affectations_index),
+        empreintes={},
+    )
+    return nouvelles, matricules, durees
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ajout d'un fichier delta")
+    parser.add_argument("delta", help="CSV des nouvelles lignes")
+    parser.add_argument("--data", default=app.DATA_PATH)
+    args = parser.parse_args(argv)
+
+    if os.path.abspath(args.data) == os.path.abspath(app.DATA_PATH):
+        donnees = app.data_store.current
+    else:
+        donnees = app.charger_donnees(args.data)
+    nouvelles, matricules, durees = ingerer(donnees, args.data, args.delta)
+
+    nouveaux = sum(m not in donnees.index for m in matricules)
+    ajouts = {
+        nom: len(table) - len(getattr(donnees.tables, nom))
+        for nom, table in nouvelles.tables._asdict().items()
+    }
+    print(
+        f"{ajouts['mesures']} mesures et {ajouts['affectations']} affectations "
+        f"ajoutées, {len(matricules)} agents ({nouveaux} nouveaux), "
+        f"en {sum(durees.values()):.2f} s"
+    )
+    for nom, duree in durees.items():
+        print(f"  {nom:<20} {duree * 1000:10.1f} ms")
+    print(f"version : {nouvelles.version}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Autocomplétion des matricules : tableau trié des matricules construit au
+# chargement des données. Les matricules commençant par un préfixe forment
+# une plage contiguë du tableau, trouvée par deux recherches binaires.
+
+# Au-delà de tout caractère d'un matricule : borne haute d'une plage de préfixe
+FIN_PREFIXE = "\U0010ffff"
+
+# Nombre de suggestions par défaut et maximum par appel
+SUGGESTIONS = 10
+SUGGESTIONS_MAX = 50
+
+# matricules : tableau trié ; cis et grade : contexte de chaque matricule,
+# aux mêmes positions (mêmes règles que la fiche agent)
+RechercheMatricules = namedtuple("RechercheMatricules", ["matricules", "cis", "grade"])
+
+
+def normalize_prefix(prefixe):
+    # Comme les matricules du formulaire : "30500.0" -> "30500"
+    prefixe = str(prefixe).strip()
+    if prefixe.endswith(".0"):
+        prefixe = prefixe[:-2]
+    return prefixe
+
+
+def _contexte(colonne, positions):
+    valeurs = colonne.take(positions)
+    return valeurs.astype(object).where(valeurs.notna(), None).to_numpy()
+
+
+def build_matricule_search(tables, index, affectations_index):
+    """Index de préfixes des matricules de `index` (agents ayant des mesures).
+
+    Contexte affiché avec chaque suggestion, sans nom : grade de la première
+    affectation et CIS de la dernière.
+    """
+    matricules = sorted(index)
+    positions = [affectations_index[m] for m in matricules]
+    premieres = np.fromiter((p[0] for p in positions), np.intp, len(positions))
+    dernieres = np.fromiter((p[-1] for p in positions), np.intp, len(positions))
+    return RechercheMatricules(
+        matricules=np.array(matricules, dtype=str),
+        cis=_contexte(tables.affectations["cis"], dernieres),
+        grade=_contexte(tables.affectations["grade"], premieres),
+    )
+
+
+def prefix_range(matricules, prefixe):
+    # Plage [debut, fin) des matricules triés qui commencent par `prefixe`
+    debut = np.searchsorted(matricules, prefixe, side="left")
+    fin = np.searchsorted(matricules, prefixe + FIN_PREFIXE, side="left")
+    return int(debut), int(fin)
+
+
+def search_matricules(recherche, prefixe, limite=SUGGESTIONS):
+    """(nombre de matricules trouvés, les `limite` premiers avec leur contexte)."""
+    debut, fin = prefix_range(recherche.matricules, normalize_prefix(prefixe))
+    suggestions = [
+        {
+            "matricule": str(recherche.matricules[i]),
+            "cis": recherche.cis[i],
+            "grade": recherche.grade[i],
+        }
+        for i in range(debut, min(fin, debut + limite))
+    ]
+    return fin - debut, suggestions
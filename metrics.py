@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+
+from flask import g, has_request_context, request
+
+# Bornes (en secondes) des histogrammes de durée
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_INACTIF = nullcontext()
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    paires = [*labels, *extra]
+    if not paires:
+        return ""
+    valeurs = ",".join(
+        '{}="{}"'.format(
+            k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in paires
+    )
+    return "{" + valeurs + "}"
+
+
+def _nombre(valeur):
+    valeur = float(valeur)
+    return str(int(valeur)) if valeur.is_integer() else repr(valeur)
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "labels", "debut")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duree = time.perf_counter() - self.debut
+        self.metrics.observe(
+            "stage_duration_seconds", duree, stage=self.name, **self.labels
+        )
+        if self.metrics.server_timing and has_request_context():
+            nom = "-".join([self.name, *map(str, self.labels.values())])
+            g.setdefault("_server_timing", []).append((nom, duree))
+        return False
+
+
+class Metrics:
+    """Compteurs et histogrammes de durée du processus, au format Prometheus.
+
+    `span(nom)` chronomètre une étape d'une requête (recherche, fiche, rendu
+    d'un graphique, template) ; avec `server_timing`, les étapes de la requête
+    sont aussi renvoyées dans l'en-tête Server-Timing. Désactivé, `span()`
+    renvoie un contexte vide partagé et `inc` / `observe` ne font rien.
+
+    Les valeurs sont propres à chaque processus : avec plusieurs workers
+    gunicorn, chaque scrape de /metrics lit celles du worker qui répond
+    (label `worker`).
+    """
+
+    def __init__(self, enabled=True, server_timing=False, prefix="pompier_"):
+        self.enabled = enabled
+        self.server_timing = enabled and server_timing
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._compteurs = defaultdict(float)
+        self._histogrammes = {}
+        self._jauges = []
+
+    def span(self, name, **labels):
+        if not self.enabled:
+            return _INACTIF
+        return _Span(self, name, labels)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._compteurs[name, _labels(labels)] += value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        cle = (name, _labels(labels))
+        with self._lock:
+            histo = self._histogrammes.get(cle)
+            if histo is None:
+                histo = self._histogrammes[cle] = [[0] * len(BUCKETS), 0, 0.0]
+            for i, borne in enumerate(BUCKETS):
+                if seconds <= borne:
+                    histo[0][i] += 1
+            histo[1] += 1
+            histo[2] += seconds
+
+    def gauge(self, fonction):
+        """Jauges lues au moment du scrape : `fonction()` -> [(nom, labels, valeur)]."""
+        self._jauges.append(fonction)
+        return fonction
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def _debut_requete():
+            g._debut_requete = time.perf_counter()
+
+        @app.after_request
+        def _fin_requete(response):
+            debut = g.pop("_debut_requete", None)
+            if debut is None:
+                return response
+            duree = time.perf_counter() - debut
+            endpoint = request.endpoint or "inconnu"
+            self.inc(
+                "http_requests_total",
+                endpoint=endpoint,
+                method=request.method,
+                status=response.status_code,
+            )
+            self.observe("http_request_duration_seconds", duree, endpoint=endpoint)
+            if self.server_timing:
+                etapes = [
+                    f"{nom};dur={d * 1000:.1f}"
+                    for nom, d in g.pop("_server_timing", [])
+                ]
+                etapes.append(f"total;dur={duree * 1000:.1f}")
+                response.headers["Server-Timing"] = ", ".join(etapes)
+            return response
+
+    def render(self, **labels):
+        """Texte d'exposition Prometheus (version 0.0.4)."""
+        commun = _labels(labels)
+        with self._lock:
+            compteurs = sorted(self._compteurs.items())
+            histogrammes = sorted(
+                (cle, (list(b), n, s)) for cle, (b, n, s) in self._histogrammes.items()
+            )
+        lignes = []
+        vus = set()
+
+        def entete(nom, type_):
+            if nom not in vus:
+                vus.add(nom)
+                lignes.append(f"# TYPE {nom} {type_}")
+
+        for (nom, lab), valeur in compteurs:
+            nom = self.prefix + nom
+            entete(nom, "counter")
+            lignes.append(f"{nom}{_format_labels(commun + lab)} {_nombre(valeur)}")
+
+        for (nom, lab), (buckets, n, somme) in histogrammes:
+            nom = self.prefix + nom
+            entete(nom, "histogram")
+            for borne, cumul in zip(BUCKETS, buckets):
+                le = (("le", f"{borne:g}"),)
+                lignes.append(f"{nom}_bucket{_format_labels(commun + lab, le)} {cumul}")
+            inf = (("le", "+Inf"),)
+            lignes.append(f"{nom}_bucket{_format_labels(commun + lab, inf)} {n}")
+            lignes.append(f"{nom}_sum{_format_labels(commun + lab)} {_nombre(somme)}")
+            lignes.append(f"{nom}_count{_format_labels(commun + lab)} {n}")
+
+        for fonction in self._jauges:
+            for nom, lab, valeur in fonction():
+                nom = self.prefix + nom
+                entete(nom, "counter" if nom.endswith("_total") else "gauge")
+                lignes.append(
+                    f"{nom}{_format_labels(commun + _labels(lab))} {_nombre(valeur)}"
+                )
+        return "\n".join(lignes) + "\n"
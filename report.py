@@ -0,0 +1,254 @@
+"""Fiches agents en lot (PDF ou PNG), pour tout le dataset ou une sélection.
+
+    python report.py --out rapports [--format pdf|png] [--workers N] [--zip]
+                     [--groupement G] [--compagnie C] [--cis X] [--grade Y]
+                     [--alertes] [--matricules 123 456 ...]
+
+Chaque fiche reprend les informations, alertes et graphiques de la page agent
+(mêmes fonctions que index()). Le rendu matplotlib étant limité par le GIL,
+les agents sont répartis par lots sur un pool de processus. Les fiches déjà
+présentes dans --out sont conservées : relancer la commande reprend là où elle
+s'était arrêtée. La progression et le débit (agents/s) sont affichés sur stderr.
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib.image as mpimg
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+import app
+from alert_engine import AFFECTATION_COLS, affectations
+from dataset import agent_rows
+
+FORMATS = ("pdf", "png")
+A4 = (8.27, 11.69)
+LOT = 20
+
+_donnees = None
+
+
+def selection(donnees, filtres=None, alertes_seulement=False, matricules=None):
+    """Matricules à traiter, dans l'ordre d'apparition du dataset."""
+    filtres = {c: v for c, v in (filtres or {}).items() if v}
+    choisis = list(donnees.index)
+    if matricules:
+        demandes = set(matricules)
+        choisis = [m for m in choisis if m in demandes]
+    if filtres:
+        par_matricule = affectations(donnees.tables.affectations)
+        choisis = [
+            m
+            for m in choisis
+            if all(par_matricule[m].get(c) == v for c, v in filtres.items())
+        ]
+    if alertes_seulement:
+        en_alerte = {a["matricule"] for a in donnees.alertes["liste"]}
+        choisis = [m for m in choisis if m in en_alerte]
+    return choisis
+
+
+def _entete(fiche):
+    lignes = [
+        f"Matricule {fiche['matricule']} — {app.na(fiche['grade'])}",
+        f"Affectation : {app.na(fiche['localisation'])}",
+        f"Catégorie : {app.na(fiche['categorie'])}    Genre : {app.na(fiche['genre'])}"
+        f"    Âge : {app.na(fiche['age'])}",
+    ]
+    poids = "N/A"
+    if fiche["poids"] is not None:
+        poids = f"{fiche['poids']} ({fiche['poids_annee']})"
+    lignes.append(f"Taille : {app.na(fiche['taille'])}    Poids : {poids}")
+    if fiche["alerte"]:
+        lignes.append(fiche["alerte"])
+    for baisse in fiche["baisses_detaillees"]:
+        lignes.append(
+            f"{baisse['test']} : -{baisse['pourcentage']}% "
+            f"({baisse['valeur_max']} en {baisse['annee_max']} -> "
+            f"{baisse['valeur_recent']} en {baisse['annee_recent']})"
+        )
+    lignes.extend(fiche["alertes_sante_details"])
+    return lignes
+
+
+def rapport_agent(donnees, matricule, format="pdf"):
+    """Fiche d'un agent sur une page A4 : en-tête texte puis grille de graphiques."""
+    agent_data = agent_rows(donnees.tables, donnees.index, matricule)
+    if agent_data.empty:
+        return None
+    fiche = app.fiches_agents(donnees, [matricule])[matricule]
+    images = []
+    for label, render, args in app.agent_charts(agent_data).values():
+        png = render(*args)
+        if png is not None:
+            images.append(mpimg.imread(io.BytesIO(png), format="png"))
+
+    fig = Figure(figsize=A4)
+    FigureCanvasAgg(fig)
+    lignes = _entete(fiche)
+    hauteur_entete = min(0.35, 0.03 + 0.022 * len(lignes))
+    for i, ligne in enumerate(lignes):
+        fig.text(
+            0.05,
+            0.97 - 0.022 * i,
+            ligne,
+            fontsize=12 if i == 0 else 8,
+            weight="bold" if i == 0 else "normal",
+            va="top",
+        )
+
+    colonnes = 2
+    rangees = max(1, -(-len(images) // colonnes))
+    grille = fig.add_gridspec(
+        rangees,
+        colonnes,
+        left=0.03,
+        right=0.97,
+        bottom=0.02,
+        top=0.97 - hauteur_entete,
+        wspace=0.05,
+        hspace=0.05,
+    )
+    for i, image in enumerate(images):
+        ax = fig.add_subplot(grille[i // colonnes, i % colonnes])
+        ax.imshow(image)
+        ax.set_axis_off()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=format, dpi=100)
+    return buf.getvalue()
+
+
+def chemin_rapport(out, matricule, format):
+    return os.path.join(out, f"{matricule}.{format}")
+
+
+def ecrire_rapport(donnees, matricule, out, format):
+    data = rapport_agent(donnees, matricule, format)
+    if data is None:
+        return False
+    chemin = chemin_rapport(out, matricule, format)
+    tmp = f"{chemin}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, chemin)
+    return True
+
+
+def _init_worker(donnees):
+    # Avec fork, les arguments du processus ne sont pas sérialisés : les
+    # données du parent restent partagées
+    global _donnees
+    _donnees = donnees
+
+
+def _traiter_lot(matricules, out, format):
+    return sum(ecrire_rapport(_donnees, m, out, format) for m in matricules)
+
+
+def _lots(matricules, taille):
+    return [matricules[i : i + taille] for i in range(0, len(matricules), taille)]
+
+
+def _progression(fait, total, debut):
+    duree = time.perf_counter() - debut
+    debit = fait / duree if duree > 0 else 0.0
+    reste = (total - fait) / debit if debit else 0.0
+    print(
+        f"\r{fait}/{total} agents  {debit:.1f} agents/s  reste ~{reste:.0f} s",
+        end="",
+        file=sys.stderr,
+        flush=True,
+    )
+
+
+def generer(donnees, matricules, out, format="pdf", workers=None):
+    """Écrit les fiches manquantes dans `out` ; renvoie (fiches écrites, durée en s)."""
+    os.makedirs(out, exist_ok=True)
+    a_faire = [
+        m for m in matricules if not os.path.exists(chemin_rapport(out, m, format))
+    ]
+    if len(a_faire) < len(matricules):
+        print(
+            f"{len(matricules) - len(a_faire)} fiches déjà présentes, ignorées",
+            file=sys.stderr,
+        )
+    workers = workers or os.cpu_count() or 1
+    debut = time.perf_counter()
+    fait = ecrits = 0
+    if workers == 1:
+        for lot in _lots(a_faire, LOT):
+            ecrits += sum(ecrire_rapport(donnees, m, out, format) for m in lot)
+            fait += len(lot)
+            _progression(fait, len(a_faire), debut)
+    else:
+        methodes = multiprocessing.get_all_start_methods()
+        contexte = multiprocessing.get_context("fork" if "fork" in methodes else None)
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=contexte,
+            initializer=_init_worker,
+            initargs=(donnees,),
+        ) as pool:
+            lots = _lots(a_faire, LOT)
+            futures = {pool.submit(_traiter_lot, lot, out, format): lot for lot in lots}
+            for future in as_completed(futures):
+                ecrits += future.result()
+                fait += len(futures[future])
+                _progression(fait, len(a_faire), debut)
+    if a_faire:
+        print(file=sys.stderr)
+    return ecrits, time.perf_counter() - debut
+
+
+def archiver(out, format, zip_path):
+    # Les fiches restent dans `out` pour pouvoir reprendre ; le zip est refait
+    tmp = f"{zip_path}.tmp"
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as archive:
+        for nom in sorted(os.listdir(out)):
+            if nom.endswith(f".{format}"):
+                archive.write(os.path.join(out, nom), nom)
+    os.replace(tmp, zip_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fiches agents en lot")
+    parser.add_argument("--out", default="rapports")
+    parser.add_argument("--format", choices=FORMATS, default="pdf")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--zip", action="store_true", help="archive <out>.zip")
+    for colonne in AFFECTATION_COLS:
+        parser.add_argument(f"--{colonne}")
+    parser.add_argument("--alertes", action="store_true", help="agents en alerte")
+    parser.add_argument("--matricules", nargs="+")
+    args = parser.parse_args(argv)
+
+    donnees = app.data_store.current
+    matricules = selection(
+        donnees,
+        filtres={c: getattr(args, c) for c in AFFECTATION_COLS},
+        alertes_seulement=args.alertes,
+        matricules=args.matricules,
+    )
+    workers = args.workers or os.cpu_count() or 1
+    ecrits, duree = generer(donnees, matricules, args.out, args.format, workers)
+    debit = ecrits / duree if duree > 0 else 0.0
+    print(
+        f"{ecrits} fiches écrites en {duree:.1f} s "
+        f"({debit:.2f} agents/s, {workers} worker(s), {os.cpu_count()} cœur(s))"
+    )
+    if args.zip:
+        zip_path = os.path.normpath(args.out) + ".zip"
+        archiver(args.out, args.format, zip_path)
+        print(f"archive : {zip_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+from collections import namedtuple
+
+import pandas as pd
+
+from dataset import load_or_build, write_snapshot
+
+# Indicateurs par unité et par année pour le tableau de bord des unités.
+# Chaque cellule (unité, année) contient des compteurs et des sommes
+# additifs : agents affectés, nombre et somme des résultats et répartition
+# des niveaux de chaque test. Moyennes, taux et répartitions s'en déduisent à
+# la lecture, sans regroupement sur les tables.
+#
+# Les alertes portent sur l'historique complet de l'agent, pas sur une
+# année : elles sont comptées à part, une fois par agent, dans l'unité de sa
+# dernière affectation (celle de la liste /alertes).
+
+# Hiérarchie des unités. Une unité est désignée par son chemin : () pour
+# l'ensemble, (groupement,), (groupement, compagnie), (groupement, compagnie, cis)
+NIVEAUX = ["groupement", "compagnie", "cis"]
+INCONNU = "non renseigné"
+
+# Valeurs des colonnes de niveau des tests (niv pompes, niveau gain...)
+NIVEAUX_TESTS = [0, 1, 2, 3]
+
+# Agents comptés d'après la table d'alertes : en alerte (liste /alertes),
+# alerte IMC, tour de taille, baisse aux tests physiques
+ALERTES = ["en_alerte", "alerte_imc", "alerte_tour", "alerte_tests"]
+
+# Format du cube sauvegardé (voir dataset.load_or_build)
+ROLLUPS_FORMAT = 2
+
+# colonnes : noms des compteurs ; cellules : {(chemin, année): compteurs} ;
+# enfants : {chemin: noms des sous-unités} ; annees : {chemin: années} ;
+# actuels : {chemin: [agents, *ALERTES]} d'après la dernière affectation
+Cube = namedtuple("Cube", ["colonnes", "cellules", "enfants", "annees", "actuels"])
+
+
+def _colonnes(tests):
+    colonnes = ["agents"]
+    for test in tests:
+        colonnes += [f"{test}|n", f"{test}|somme"]
+        colonnes += [f"{test}|niv{niveau}" for niveau in NIVEAUX_TESTS]
+    return colonnes
+
+
+def _drapeaux(agent):
+    imc = "imc" in agent["alertes_sante"]
+    tour = "tour" in agent["alertes_sante"]
+    tests = agent["alerte"] is not None
+    return [bool(agent["alertes_sante"]) or tests, imc, tour, tests]
+
+
+def _cube(colonnes, cellules, actuels):
+    enfants, annees = {}, {}
+    for chemin, annee in cellules:
+        annees.setdefault(chemin, set()).add(annee)
+        if chemin:
+            enfants.setdefault(chemin[:-1], set()).add(chemin[-1])
+    return Cube(
+        colonnes=colonnes,
+        cellules=cellules,
+        enfants={chemin: sorted(noms) for chemin, noms in enfants.items()},
+        annees={chemin: sorted(a) for chemin, a in annees.items()},
+        actuels=actuels,
+    )
+
+
+def _sommes(base, colonnes, cles_base):
+    # {(chemin, *cles_base): sommes des colonnes} à chaque niveau d'unité ;
+    # un agent compte une fois par unité et par clé
+    sommes = {}
+    for profondeur in range(len(NIVEAUX) + 1):
+        cles = [*NIVEAUX[:profondeur], *cles_base]
+        lignes = base.drop_duplicates(["matricule", *cles])
+        if not cles:
+            sommes[((),)] = lignes[colonnes].sum().to_numpy()
+            continue
+        groupes = lignes.groupby(cles, sort=False)[colonnes].sum()
+        for cle, ligne in zip(groupes.index, groupes.to_numpy()):
+            cle = cle if isinstance(cle, tuple) else (cle,)
+            chemin = tuple(cle[:profondeur])
+            sommes[(chemin, *(int(c) for c in cle[profondeur:]))] = ligne
+    return sommes
+
+
+def build_rollups(tables, alertes, niveau_cols):
+    """Cube des indicateurs de chaque unité, à chaque niveau, pour chaque année.
+
+    Un agent compte une fois par unité et par année où il y est affecté, avec
+    sa première mesure renseignée de l'année pour chaque colonne. Ses alertes
+    comptent une seule fois, dans l'unité de sa dernière affectation.
+    """
+    mesures = tables.mesures
+    tests = [
+        t for t, niv in niveau_cols.items() if t in mesures.columns and niv in mesures
+    ]
+    colonnes = _colonnes(tests)
+
+    premieres = (
+        mesures[["matricule", "année", *tests, *(niveau_cols[t] for t in tests)]]
+        .groupby(["matricule", "année"], sort=False, observed=True)
+        .first()
+    )
+    valeurs = {}
+    for test in tests:
+        resultat = premieres[test].astype(float)
+        niveau = premieres[niveau_cols[test]].astype(float)
+        valeurs[f"{test}|n"] = resultat.notna()
+        valeurs[f"{test}|somme"] = resultat.fillna(0)
+        for k in NIVEAUX_TESTS:
+            valeurs[f"{test}|niv{k}"] = niveau == k
+    valeurs = pd.DataFrame(valeurs, index=premieres.index).reset_index()
+
+    par_agent = alertes["par_agent"]
+    drapeaux = pd.DataFrame(
+        [_drapeaux(par_agent[m]) for m in tables.agents.index if m in par_agent],
+        index=pd.Index(
+            [m for m in tables.agents.index if m in par_agent], name="matricule"
+        ),
+        columns=ALERTES,
+    )
+
+    unites = tables.affectations[["matricule", "année", *NIVEAUX]].astype(
+        {niveau: object for niveau in NIVEAUX}
+    )
+    unites = unites.fillna({niveau: INCONNU for niveau in NIVEAUX})
+    base = unites.drop_duplicates().merge(
+        valeurs, on=["matricule", "année"], how="left"
+    )
+    base["agents"] = 1
+    base[colonnes] = base[colonnes].fillna(0).astype(float)
+    cellules = _sommes(base, colonnes, ["année"])
+
+    # Dernière ligne d'affectation de chaque agent, comme la liste /alertes
+    dernieres = unites.groupby("matricule", sort=False).tail(1)
+    dernieres = dernieres.join(drapeaux, on="matricule")
+    dernieres["agents"] = 1
+    compteurs = ["agents", *ALERTES]
+    dernieres[compteurs] = dernieres[compteurs].fillna(0).astype(float)
+    actuels = {
+        cle[0]: ligne for cle, ligne in _sommes(dernieres, compteurs, []).items()
+    }
+    return _cube(colonnes, cellules, actuels)
+
+
+def load_rollups(tables, alertes, niveau_cols, key, cache_path=None):
+    """Cube lu dans cache_path si l'empreinte correspond, sinon recalculé."""
+    return load_or_build(
+        cache_path,
+        f"{key}-v{ROLLUPS_FORMAT}",
+        lambda: build_rollups(tables, alertes, niveau_cols),
+    )
+
+
+def save_rollups(cache_path, key, cube):
+    write_snapshot(cache_path, f"{key}-v{ROLLUPS_FORMAT}", cube)
+
+
+def update_rollups(cube, avant, alertes_avant, apres, alertes_apres, niveau_cols):
+    """Cube après remplacement des données de quelques agents.
+
+    `avant` et `apres` : tables réduites à ces agents (subset_tables), avec la
+    table d'alertes correspondante. Les compteurs étant additifs, les
+    contributions de ces agents sont retirées puis les nouvelles ajoutées.
+    """
+    retire = build_rollups(avant, alertes_avant, niveau_cols)
+    ajoute = build_rollups(apres, alertes_apres, niveau_cols)
+    cellules = _mise_a_jour(cube.cellules, retire.cellules, ajoute.cellules)
+    actuels = _mise_a_jour(cube.actuels, retire.actuels, ajoute.actuels)
+    return _cube(cube.colonnes, cellules, actuels)
+
+
+def _mise_a_jour(compteurs, retire, ajoute):
+    compteurs = dict(compteurs)
+    for cle, ligne in retire.items():
+        compteurs[cle] = compteurs[cle] - ligne
+    for cle, ligne in ajoute.items():
+        compteurs[cle] = compteurs[cle] + ligne if cle in compteurs else ligne
+    # Unités (ou années) sans plus aucun agent : le premier compteur est l'effectif
+    return {cle: ligne for cle, ligne in compteurs.items() if ligne[0] > 0}
+
+
+def _pourcentage(nombre, total):
+    return round(100 * nombre / total, 1) if total else None
+
+
+def indicateurs(cube, chemin, annee, test_labels):
+    """Indicateurs d'une unité pour une année, lus dans sa cellule.
+
+    Effectif, et pour chaque test le nombre de résultats, leur moyenne et la
+    répartition (%) des niveaux.
+    """
+    valeurs = dict(zip(cube.colonnes, cube.cellules[chemin, annee].tolist()))
+    resultat = {"agents": int(valeurs["agents"]), "tests": []}
+    for test, label in test_labels.items():
+        if f"{test}|n" not in valeurs:
+            continue
+        n = int(valeurs[f"{test}|n"])
+        niveaux = {k: valeurs[f"{test}|niv{k}"] for k in NIVEAUX_TESTS}
+        classes = sum(niveaux.values())
+        resultat["tests"].append(
+            {
+                "test": label,
+                "resultats": n,
+                "moyenne": round(valeurs[f"{test}|somme"] / n, 1) if n else None,
+                "niveaux": {
+                    str(k): _pourcentage(nombre, classes)
+                    for k, nombre in niveaux.items()
+                },
+            }
+        )
+    return resultat
+
+
+def alertes_actuelles(cube, chemin):
+    """Agents ayant leur dernière affectation dans l'unité, % en alerte par type."""
+    valeurs = cube.actuels.get(chemin)
+    valeurs = [0] * (1 + len(ALERTES)) if valeurs is None else valeurs.tolist()
+    agents = int(valeurs[0])
+    resultat = {"agents": agents}
+    resultat.update({a: _pourcentage(n, agents) for a, n in zip(ALERTES, valeurs[1:])})
+    return resultat
+
+
+def drill_down(cube, chemin, test_labels, annee=None):
+    """Vue d'une unité : indicateurs de l'année, évolution et sous-unités.
+
+    Les alertes (clé "alertes", pour l'unité et chaque sous-unité) ne
+    dépendent pas de l'année : ce sont celles des agents qui y ont leur
+    dernière affectation.
+
+    Année par défaut : la plus récente de l'unité. None si l'unité n'existe
+    pas ou n'a pas d'agent affecté cette année-là.
+    """
+    chemin = tuple(chemin)
+    annees = cube.annees.get(chemin)
+    if not annees:
+        return None
+    annee = annees[-1] if annee is None else annee
+    if annee not in annees:
+        return None
+    sous_unites = [
+        {
+            "nom": nom,
+            **indicateurs(cube, (*chemin, nom), annee, test_labels),
+            "alertes": alertes_actuelles(cube, (*chemin, nom)),
+        }
+        for nom in cube.enfants.get(chemin, [])
+        if ((*chemin, nom), annee) in cube.cellules
+    ]
+    return {
+        "chemin": dict(zip(NIVEAUX, chemin)),
+        "sous_niveau": NIVEAUX[len(chemin)] if len(chemin) < len(NIVEAUX) else None,
+        "annee": annee,
+        "annees": annees,
+        "indicateurs": indicateurs(cube, chemin, annee, test_labels),
+        "alertes": alertes_actuelles(cube, chemin),
+        "evolution": [
+            {"annee": a, **indicateurs(cube, chemin, a, test_labels)} for a in annees
+        ],
+        "sous_unites": sous_unites,
+    }
@@ -0,0 +1,263 @@
+"""Le moteur d'alertes vectorisé donne les mêmes résultats que l'analyse
+agent par agent des anciennes vues index() et alertes().
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+RACINE = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, RACINE)
+
+from alert_engine import build_alert_table  # noqa: E402
+from dataset import (  # noqa: E402
+    agent_rows,
+    build_matricule_index,
+    load_tables,
+    split_tables,
+)
+
+TEST_LABELS = {
+    "resul gain": "Gainage",
+    "resul killy": "Killy",
+    "resul pompes": "Pompes",
+    "resul souplesse": "Souplesse",
+    "resul tractions": "Tractions",
+}
+
+# --- Référence : logique par agent d'origine ---
+# Les tris sont stables : entre deux lignes d'une même année, la dernière du
+# CSV est la plus récente, comme dans le moteur.
+
+
+def imc_categorie(imc):
+    if imc >= 40:
+        return "Obésité massive"
+    elif imc >= 35:
+        return "Obésité sévère"
+    elif imc >= 30:
+        return "Obésité modérée"
+    elif imc >= 25:
+        return "Surpoids"
+    else:
+        return "Normal"
+
+
+NIVEAUX_IMC = [
+    "Normal",
+    "Surpoids",
+    "Obésité modérée",
+    "Obésité sévère",
+    "Obésité massive",
+]
+
+
+def reference_sante(agent_data):
+    alertes_sante = []
+    alertes_sante_details = []
+
+    imc_data = agent_data[["année", "imc"]].dropna()
+    imc_data = imc_data[imc_data["année"].between(2019, 2024)]
+    imc_data = imc_data.sort_values("année", kind="stable")
+    if len(imc_data) >= 2:
+        debut = imc_data.iloc[0]
+        fin = imc_data.iloc[-1]
+        cat_debut = imc_categorie(debut["imc"])
+        cat_fin = imc_categorie(fin["imc"])
+        if NIVEAUX_IMC.index(cat_fin) > NIVEAUX_IMC.index(cat_debut):
+            alertes_sante.append("imc")
+            alertes_sante_details.append(
+                f"IMC est passé de {debut['imc']:.1f} ({cat_debut}) en "
+                f"{int(debut['année'])} à {fin['imc']:.1f} ({cat_fin}) en "
+                f"{int(fin['année'])}"
+            )
+
+    sexe_data = agent_data["sexe"].dropna()
+    if not sexe_data.empty:
+        sexe = sexe_data.iloc[-1].strip().lower()
+        tour_data = agent_data[["année", "périmétre abdominal"]].dropna()
+        tour_data = tour_data[tour_data["année"].between(2019, 2024)]
+        tour_data = tour_data.sort_values("année", kind="stable")
+        if len(tour_data) >= 2:
+            seuil = 94 if sexe == "homme" else 80
+            depasse = tour_data[tour_data["périmétre abdominal"] > seuil]
+            if not depasse.empty:
+                alertes_sante.append("tour")
+                alertes_sante_details.append(
+                    f"Tour de taille a dépassé {seuil} cm ({sexe}) en "
+                    f"{int(depasse.iloc[0]['année'])} avec "
+                    f"{depasse.iloc[0]['périmétre abdominal']:.1f} cm"
+                )
+
+    return alertes_sante, alertes_sante_details
+
+
+def reference_baisses(agent_data, test_labels):
+    baisses = []
+    baisses_detaillees = []
+    for test, label in test_labels.items():
+        test_data = agent_data[["année", test]].dropna()
+        valeurs = test_data.set_index("année")[test]
+        valeurs = valeurs.loc[valeurs.index.isin(range(2019, 2025))]
+        if len(valeurs) < 2:
+            continue
+        val_max = valeurs.max()
+        an_max = valeurs.idxmax()
+        val_recent = valeurs.sort_index(kind="stable").iloc[-1]
+        an_recent = valeurs.sort_index(kind="stable").index[-1]
+        if val_max == 0:
+            continue
+        baisse_pct = ((val_max - val_recent) / val_max) * 100
+        baisses.append(baisse_pct)
+        if baisse_pct >= 10:
+            baisses_detaillees.append(
+                {
+                    "test": label,
+                    "pourcentage": round(float(baisse_pct), 1),
+                    "valeur_max": float(val_max),
+                    "annee_max": int(an_max),
+                    "valeur_recent": float(val_recent),
+                    "annee_recent": int(an_recent),
+                }
+            )
+
+    alerte = None
+    if any(b >= 30 for b in baisses):
+        alerte = "⚠️ Alerte : une baisse ≥ 30% a été détectée sur un test."
+    elif sum(1 for b in baisses if b >= 20) >= 2:
+        alerte = "⚠️ Alerte : deux tests ont baissé de ≥ 20%."
+    elif sum(1 for b in baisses if b >= 10) >= 3:
+        alerte = "⚠️ Alerte : trois tests ou plus ont baissé de ≥ 10%."
+    return alerte, baisses_detaillees
+
+
+def reference(tables, test_labels, matricules):
+    """(liste /alertes, détail par agent) calculés agent par agent."""
+    index = build_matricule_index(tables.mesures)
+    liste, par_agent = [], {}
+    for mat in matricules:
+        if mat not in index:
+            continue
+        agent_data = agent_rows(tables, index, mat)
+        alertes_sante, details = reference_sante(agent_data)
+        alerte, baisses_detaillees = reference_baisses(agent_data, test_labels)
+        types = []
+        if alertes_sante:
+            types.append("Santé")
+        if alerte:
+            types.append("Tests physiques")
+        if types:
+            liste.append((mat, len(types), ", ".join(types)))
+        if alertes_sante or alerte or baisses_detaillees:
+            par_agent[mat] = {
+                "alerte": alerte,
+                "baisses_detaillees": baisses_detaillees,
+                "alertes_sante": alertes_sante,
+                "alertes_sante_details": details,
+            }
+    return liste, par_agent
+
+
+def comparer(tables, test_labels, matricules):
+    table = build_alert_table(tables, test_labels)
+    attendu_liste, attendu_par_agent = reference(tables, test_labels, matricules)
+    matricules = set(matricules)
+    liste = [
+        (a["matricule"], a["nombre"], a["types"])
+        for a in table["liste"]
+        if a["matricule"] in matricules
+    ]
+    par_agent = {m: a for m, a in table["par_agent"].items() if m in matricules}
+    assert liste == attendu_liste
+    assert par_agent == attendu_par_agent
+
+
+# --- Jeu de données réduit couvrant les cas limites ---
+
+
+def ligne(matricule, annee, sexe="homme", imc=None, tour=None, **tests):
+    return {
+        "matricule": matricule,
+        "année": annee,
+        "sexe": sexe,
+        "cis": "CIS TEST",
+        "imc": imc,
+        "périmétre abdominal": tour,
+        **{f"resul {test}": valeur for test, valeur in tests.items()},
+    }
+
+
+@pytest.fixture
+def tables():
+    lignes = [
+        # Deux sessions la même année : la dernière ligne est la plus récente,
+        # le maximum à égalité est celui de la première ligne
+        ligne("100", 2019, imc=24.0, gain=100, pompes=40),
+        ligne("100", 2023, imc=31.0, gain=60, pompes=40),
+        ligne("100", 2023, imc=26.0, gain=100, pompes=20),
+        # Maximum à 0 (souplesse négative ensuite) : test ignoré ; deux
+        # baisses de 20 % ailleurs
+        ligne("200", 2020, souplesse=0, killy=50, tractions=10),
+        ligne("200", 2024, souplesse=-4, killy=40, tractions=8),
+        # Une seule mesure : ni baisse ni alerte santé
+        ligne("300", 2021, imc=45.0, tour=120.0, gain=100),
+        # Tour de taille dépassé (femme, seuil 80), années hors fenêtre ignorées
+        ligne("400", 2018, sexe="femme", tour=70.0, gain=100),
+        ligne("400", 2020, sexe="femme", tour=79.0, gain=100),
+        ligne("400", 2022, sexe="femme", tour=82.5, gain=95),
+        # Trois baisses de 10 %, tour de taille homme sous le seuil de 94
+        ligne("500", 2019, tour=93.0, gain=100, killy=100, pompes=100),
+        ligne("500", 2024, tour=94.0, gain=88, killy=89, pompes=90),
+        # IMC en baisse de catégorie : pas d'alerte
+        ligne("600", 2019, imc=31.0, tractions=10),
+        ligne("600", 2022, imc=24.0, tractions=2),
+        # Ligne d'affectation répétée : dédoublonnée à la séparation
+        ligne("600", 2022, imc=24.0, tractions=2),
+    ]
+    df = pd.DataFrame(lignes)
+    df["matricule"] = df["matricule"].astype(str)
+    return split_tables(df)
+
+
+def test_cas_limites(tables):
+    comparer(tables, TEST_LABELS, list(tables.agents.index))
+
+
+def test_cas_limites_resultats(tables):
+    table = build_alert_table(tables, TEST_LABELS)
+    liste = {a["matricule"]: a["types"] for a in table["liste"]}
+    assert liste == {
+        "100": "Santé, Tests physiques",
+        "200": "Tests physiques",
+        "400": "Santé",
+        "500": "Tests physiques",
+        "600": "Tests physiques",
+    }
+    # Égalité dans l'année : la session la plus récente est la dernière ligne
+    baisses = table["par_agent"]["100"]["baisses_detaillees"]
+    assert [(b["test"], b["annee_max"], b["pourcentage"]) for b in baisses] == [
+        ("Pompes", 2019, 50.0)
+    ]
+    assert table["par_agent"]["100"]["alertes_sante"] == ["imc"]
+    assert table["par_agent"]["200"]["alerte"] == (
+        "⚠️ Alerte : deux tests ont baissé de ≥ 20%."
+    )
+    assert "300" not in table["par_agent"]
+
+
+def test_dataset_livre():
+    tables = load_tables(os.path.join(RACINE, "dataset_corrige.csv"))
+    test_labels = {
+        "resul gain": "Gainage",
+        "resul killy": "Killy",
+        "resul ll": "Luc Léger",
+        "resul pompes": "Pompes",
+        "resul souplesse": "Souplesse",
+        "resul tractions": "Tractions",
+    }
+    # Un agent sur dix suffit à couvrir les cas du fichier
+    comparer(tables, test_labels, list(tables.agents.index[::10]))
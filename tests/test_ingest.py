@@ -0,0 +1,98 @@
+"""L'ajout d'un delta (ingest.ingerer) donne les mêmes tables dérivées qu'un
+rechargement complet du fichier obtenu.
+
+    python -m pytest tests
+"""
+
+import csv
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+
+RACINE = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, RACINE)
+
+import app  # noqa: E402
+from dataset import tables_memory  # noqa: E402
+from ingest import ingerer  # noqa: E402
+
+# Année retirée du dataset livré puis ajoutée comme delta
+ANNEE_DELTA = "2024"
+# Lignes déjà présentes renvoyées avec le delta (doublons à ignorer)
+RENVOYEES = 50
+
+
+def separer(source, base, delta):
+    # Lignes de ANNEE_DELTA dans `delta`, les autres dans `base` (même en-tête),
+    # plus quelques lignes de `base` renvoyées en tête du delta
+    with open(source, newline="", encoding="utf-8") as f:
+        lecteur = csv.reader(f)
+        entete = next(lecteur)
+        lignes = list(lecteur)
+    annee = [c.strip().lower() for c in entete].index("année")
+    anciennes = [ligne for ligne in lignes if ligne[annee] != ANNEE_DELTA]
+    nouvelles = [ligne for ligne in lignes if ligne[annee] == ANNEE_DELTA]
+    for chemin, contenu in [
+        (base, anciennes),
+        (delta, anciennes[-RENVOYEES:] + nouvelles),
+    ]:
+        with open(chemin, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(entete)
+            writer.writerows(contenu)
+
+
+def assert_identiques(a, b, chemin="racine"):
+    # Comparaison récursive des tables dérivées (dicts, listes, tableaux, cubes)
+    if isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b, obj=chemin)
+    elif isinstance(a, np.ndarray) and a.dtype.kind == "f":
+        np.testing.assert_allclose(a, b, err_msg=chemin)
+    elif isinstance(a, np.ndarray):
+        np.testing.assert_array_equal(a, b, err_msg=chemin)
+    elif isinstance(a, dict):
+        assert a.keys() == b.keys(), chemin
+        for cle in a:
+            assert_identiques(a[cle], b[cle], f"{chemin}[{cle!r}]")
+    elif isinstance(a, (list, tuple)):
+        assert type(a) is type(b) and len(a) == len(b), chemin
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert_identiques(x, y, f"{chemin}[{i}]")
+    else:
+        assert a == b, chemin
+
+
+def test_delta_comme_rechargement(tmp_path):
+    path = str(tmp_path / "data.csv")
+    delta_path = str(tmp_path / "delta.csv")
+    separer(os.path.join(RACINE, "dataset_corrige.csv"), path, delta_path)
+
+    donnees = app.charger_donnees(path)
+    nouvelles, matricules, _ = ingerer(donnees, path, delta_path)
+    assert matricules
+
+    # Rechargement complet du fichier produit, sans les tables sauvegardées
+    # par l'ingestion
+    complet = tmp_path / "complet"
+    complet.mkdir()
+    shutil.copy(path, complet / "data.csv")
+    attendu = app.charger_donnees(str(complet / "data.csv"))
+
+    assert nouvelles.version == attendu.version
+    for nom in ["tables", "index", "affectations_index", "alertes", "cohortes"]:
+        assert_identiques(getattr(nouvelles, nom), getattr(attendu, nom), nom)
+    assert_identiques(nouvelles.unites._asdict(), attendu.unites._asdict(), "unites")
+    assert_identiques(
+        nouvelles.recherche._asdict(), attendu.recherche._asdict(), "recherche"
+    )
+    # Catégories des matricules toujours partagées entre les tables
+    pd.testing.assert_series_equal(
+        tables_memory(nouvelles.tables), tables_memory(attendu.tables)
+    )
+
+    # Un serveur qui recharge le fichier lit les tables écrites par l'ingestion
+    relu = app.charger_donnees(path)
+    assert_identiques(relu.unites._asdict(), attendu.unites._asdict(), "relu")